@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import uuid
+from contextlib import closing
+from werkzeug.security import safe_join
+
+import archive_index
+from jsonfile import locked, write_json
+
+# Entries younger than this are left in the journal, so bursts of notes are folded in together
+COMPACT_MIN_AGE = 30
+
+# Seconds between background compaction passes
+COMPACT_INTERVAL = 60
+
+def append(conn, json_path, kind, value):
+    """Record an annotation ("annotation") or a notes change ("notes") for a sidecar.
+
+    A constant-size insert, whatever the size of the transcript. Annotations get
+    a unique id, so compaction can tell which ones a sidecar already contains.
+    """
+    if kind == "annotation" and isinstance(value, dict):
+        value = dict(value, id=uuid.uuid4().hex)
+    with conn:
+        conn.execute(
+            "INSERT INTO journal (json_path, kind, value, created) VALUES (?, ?, ?, ?)",
+            (json_path, kind, json.dumps(value), time.time())
+        )
+
+def pending(conn, json_path):
+    """Journal entries of a sidecar not yet compacted into it, oldest first."""
+    return [
+        (row["id"], row["kind"], json.loads(row["value"]))
+        for row in conn.execute(
+            "SELECT id, kind, value FROM journal WHERE json_path = ? ORDER BY id", (json_path,)
+        )
+    ]
+
+def last_id(conn, json_path):
+    """Id of the newest journal entry of a sidecar, or 0. Changes with every append and compaction."""
+    row = conn.execute(
+        "SELECT MAX(id) AS id FROM journal WHERE json_path = ?", (json_path,)
+    ).fetchone()
+    return row["id"] or 0
+
+def merge(data, entries):
+    """Apply journal entries to a parsed sidecar, in place. Safe to repeat."""
+    for _, kind, value in entries:
+        if kind == "notes":
+            data["notes"] = value
+        elif kind == "annotation":
+            annotations = data.setdefault("annotations", [])
+            if not isinstance(value, dict) or all(a.get("id") != value.get("id") for a in annotations if isinstance(a, dict)):
+                annotations.append(value)
+    return data
+
+def compact_transcript(conn, audio_folder, json_path):
+    """Fold the journal entries of one sidecar into the file, then drop them from the journal."""
+    transcription_path = safe_join(audio_folder, json_path)
+    entries = pending(conn, json_path)
+    if not entries:
+        return
+    if transcription_path is None:
+        # Never write outside the audio folder; such entries can only be left over from old versions
+        print(f"Dropping journal entries of {json_path}, which is outside the audio folder")
+        with conn:
+            conn.execute("DELETE FROM journal WHERE json_path = ?", (json_path,))
+        return
+    if not os.path.exists(transcription_path):
+        print(f"Keeping journal entries of missing transcription {json_path}")
+        return
+
+    with locked(transcription_path):
+        with open(transcription_path, 'r') as file:
+            data = json.load(file)
+        write_json(transcription_path, merge(data, entries))
+
+    # Merging is idempotent, so a crash before this delete only means a repeat
+    with conn:
+        conn.execute(
+            "DELETE FROM journal WHERE json_path = ? AND id <= ?", (json_path, entries[-1][0])
+        )
+    # The segments did not change, only record the new mtime
+    archive_index.update_segments(conn, audio_folder, json_path, {})
+
+def compact(audio_folder, min_age=COMPACT_MIN_AGE):
+    """Compact every sidecar whose newest journal entry is older than min_age seconds."""
+    with closing(archive_index.connect(audio_folder)) as conn:
+        json_paths = [
+            row["json_path"]
+            for row in conn.execute(
+                "SELECT json_path FROM journal GROUP BY json_path HAVING MAX(created) < ?",
+                (time.time() - min_age,)
+            )
+        ]
+        for json_path in json_paths:
+            try:
+                compact_transcript(conn, audio_folder, json_path)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Error compacting journal of {json_path}: {e}")
+
+def compact_forever(audio_folder, interval=COMPACT_INTERVAL):
+    """Background thread body: compact the journal every interval seconds."""
+    while True:
+        time.sleep(interval)
+        compact(audio_folder)
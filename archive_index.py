@@ -0,0 +1,495 @@
+import os
+import json
+import sqlite3
+import time
+import threading
+from contextlib import contextmanager
+from naming import parse_filename
+from wavfile import WavError, read_header
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialised
+    fcntl = None
+
+# The index lives inside the audio folder so it travels with the archive
+INDEX_FILENAME = ".audio_browser.sqlite"
+
+# Held by whichever thread or process is scanning the archive
+REFRESH_LOCK_FILENAME = ".audio_browser.refresh.lock"
+
+# Seconds between two mtime scans of the archive triggered by requests
+REFRESH_INTERVAL = 30
+
+# Segment rows use rowid = transcript id * SEGMENT_STRIDE + segment index,
+# so all rows of one transcript can be dropped with a cheap rowid range
+SEGMENT_STRIDE = 1_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    json_path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments USING fts5(
+    text,
+    start UNINDEXED,
+    stop UNINDEXED,
+    tokenize = 'trigram'
+);
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    json_mtime_ns INTEGER,
+    duration REAL,
+    date TEXT,
+    place TEXT
+);
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY,
+    json_path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS journal_by_path ON journal (json_path, id);
+CREATE TABLE IF NOT EXISTS queue (
+    path TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    state TEXT NOT NULL,
+    enqueued REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    speed REAL,
+    worker TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS queue_order ON queue (state, priority, duration, enqueued);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+_refresh_locks = {}
+_refresh_locks_lock = threading.Lock()
+
+_initialized = set()
+_initialized_lock = threading.Lock()
+_thread_connections = threading.local()
+
+def connect(audio_folder):
+    """Open a new connection to the index database of an audio folder.
+
+    The database and its tables are created by the first connection of the
+    process; later ones skip that.
+    """
+    path = os.path.join(audio_folder, INDEX_FILENAME)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _initialized_lock:
+        if path not in _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _initialized.add(path)
+    return conn
+
+def thread_connection(audio_folder):
+    """The connection of the calling thread to the index of an audio folder.
+
+    It is opened on first use and kept open for the thread's later calls, so
+    request handlers do not pay for a new connection on every request.
+    """
+    connections = getattr(_thread_connections, "by_folder", None)
+    if connections is None:
+        connections = _thread_connections.by_folder = {}
+    conn = connections.get(audio_folder)
+    if conn is None:
+        conn = connections[audio_folder] = connect(audio_folder)
+    return conn
+
+def scan(audio_folder):
+    """Stat every .wav and .json in the archive in a single walk.
+
+    Returns two dicts mapping paths relative to the audio folder to stat results.
+    """
+    recordings = {}
+    transcripts = {}
+    for root, _, files in os.walk(audio_folder):
+        for file_name in files:
+            if file_name.startswith('.'):
+                continue
+            if file_name.endswith('.wav'):
+                found = recordings
+            elif file_name.endswith('.json'):
+                found = transcripts
+            else:
+                continue
+            file_path = os.path.join(root, file_name)
+            try:
+                found[os.path.relpath(file_path, audio_folder)] = os.stat(file_path)
+            except OSError:
+                # Deleted since the listing, or not accessible
+                continue
+    return recordings, transcripts
+
+def transcript_path(audio_path):
+    """Path of the .json sidecar belonging to a .wav path."""
+    return os.path.splitext(audio_path)[0] + '.json'
+
+def index_transcript(conn, audio_folder, json_path, stat=None):
+    """(Re)index the segments of one sidecar, given its path relative to the audio folder.
+
+    Returns the parsed sidecar, or None if it is missing or unreadable. A sidecar
+    that disappeared is dropped from the index; one that cannot be read is left
+    as it was and tried again on the next scan.
+    """
+    file_path = os.path.join(audio_folder, json_path)
+    data = None
+    segments = []
+    try:
+        if stat is None:
+            stat = os.stat(file_path)
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            data = json.load(f)
+        if isinstance(data, dict) and isinstance(data.get("transcript"), list):
+            segments = data["transcript"]
+    except FileNotFoundError:
+        remove_transcript(conn, json_path)
+        return None
+    except OSError as e:
+        print(f"Skipping unreadable JSON file {file_path}: {e}")
+        return None
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        # Still record the mtime, so the file is not re-parsed on every scan
+        print(f"Skipping invalid JSON file {file_path}: {e}")
+
+    with conn:
+        conn.execute(
+            "INSERT INTO transcripts (json_path, mtime_ns, size) VALUES (?, ?, ?) "
+            "ON CONFLICT(json_path) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size",
+            (json_path, stat.st_mtime_ns, stat.st_size)
+        )
+        transcript_id = conn.execute(
+            "SELECT id FROM transcripts WHERE json_path = ?", (json_path,)
+        ).fetchone()["id"]
+        base = transcript_id * SEGMENT_STRIDE
+        conn.execute(
+            "DELETE FROM segments WHERE rowid BETWEEN ? AND ?",
+            (base, base + SEGMENT_STRIDE - 1)
+        )
+        conn.executemany(
+            "INSERT INTO segments (rowid, text, start, stop) VALUES (?, ?, ?, ?)",
+            (
+                (base + index, segment.get("text", ""), segment.get("start"), segment.get("end"))
+                for index, segment in enumerate(segments[:SEGMENT_STRIDE])
+            )
+        )
+    return data if isinstance(data, dict) else None
+
+def update_segments(conn, audio_folder, json_path, segments):
+    """Re-index only the given {index: segment} of a sidecar that was just rewritten."""
+    stat = os.stat(os.path.join(audio_folder, json_path))
+    with conn:
+        row = conn.execute(
+            "SELECT id FROM transcripts WHERE json_path = ?", (json_path,)
+        ).fetchone()
+        if row is None:
+            # Not indexed yet, the next refresh picks up the whole file
+            return
+        conn.execute(
+            "UPDATE transcripts SET mtime_ns = ?, size = ? WHERE id = ?",
+            (stat.st_mtime_ns, stat.st_size, row["id"])
+        )
+        # Keep the catalog entry current too, so the edit does not trigger a re-read
+        conn.execute(
+            "UPDATE recordings SET json_mtime_ns = ? WHERE path = ?",
+            (stat.st_mtime_ns, os.path.splitext(json_path)[0] + '.wav')
+        )
+        base = row["id"] * SEGMENT_STRIDE
+        for index, segment in segments.items():
+            conn.execute("DELETE FROM segments WHERE rowid = ?", (base + index,))
+            conn.execute(
+                "INSERT INTO segments (rowid, text, start, stop) VALUES (?, ?, ?, ?)",
+                (base + index, segment.get("text", ""), segment.get("start"), segment.get("end"))
+            )
+
+def remove_transcript(conn, json_path):
+    """Drop a sidecar and its segments from the index."""
+    with conn:
+        row = conn.execute(
+            "SELECT id FROM transcripts WHERE json_path = ?", (json_path,)
+        ).fetchone()
+        if row is None:
+            return
+        base = row["id"] * SEGMENT_STRIDE
+        conn.execute(
+            "DELETE FROM segments WHERE rowid BETWEEN ? AND ?",
+            (base, base + SEGMENT_STRIDE - 1)
+        )
+        conn.execute("DELETE FROM transcripts WHERE id = ?", (row["id"],))
+
+def update_transcript(conn, audio_folder, json_path):
+    """Re-index a sidecar that was just rewritten, along with its recording's catalog entry."""
+    data = index_transcript(conn, audio_folder, json_path)
+    audio_path = os.path.splitext(json_path)[0] + '.wav'
+    try:
+        stat = os.stat(os.path.join(audio_folder, audio_path))
+        json_stat = os.stat(os.path.join(audio_folder, json_path))
+    except FileNotFoundError:
+        return
+    index_recording(conn, audio_folder, audio_path, stat, json_stat, data)
+
+def wav_duration(file_path):
+    """Duration of a .wav file in minutes, read from its header."""
+    try:
+        return read_header(file_path).duration / 60
+    except (WavError, OSError):
+        return None
+
+def index_recording(conn, audio_folder, audio_path, stat, json_stat=None, data=None):
+    """(Re)catalog one recording, given its path relative to the audio folder.
+
+    data is the already parsed sidecar if the caller has it at hand.
+    """
+    if json_stat is not None and data is None:
+        try:
+            with open(os.path.join(audio_folder, transcript_path(audio_path)), 'r', encoding='utf-8', errors='replace') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+            data = None
+    if not isinstance(data, dict):
+        data = {}
+
+    date, place, _ = parse_filename(os.path.basename(audio_path))
+    duration = data.get("duration")
+    if not isinstance(duration, (int, float)):
+        duration = wav_duration(os.path.join(audio_folder, audio_path))
+
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO recordings (path, size, mtime_ns, json_mtime_ns, duration, date, place) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                audio_path,
+                stat.st_size,
+                stat.st_mtime_ns,
+                json_stat.st_mtime_ns if json_stat is not None else None,
+                duration,
+                data.get("date") or date,
+                data.get("place") or place
+            )
+        )
+
+@contextmanager
+def refresh_lock(audio_folder, blocking=True):
+    """Hold the refresh lock of an audio folder, against other threads and processes.
+
+    Yields whether the lock was acquired; with blocking=False it is not waited for.
+    """
+    with _refresh_locks_lock:
+        thread_lock = _refresh_locks.setdefault(os.path.abspath(audio_folder), threading.Lock())
+    if not thread_lock.acquire(blocking):
+        yield False
+        return
+    try:
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.join(audio_folder, REFRESH_LOCK_FILENAME), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        thread_lock.release()
+
+def refresh(conn, audio_folder):
+    """Bring the index up to date, re-reading only files whose mtime or size changed.
+
+    Waits for a scan running in another thread or process to finish first.
+    """
+    with refresh_lock(audio_folder):
+        _refresh(conn, audio_folder)
+
+def _refresh(conn, audio_folder):
+    recordings, transcripts = scan(audio_folder)
+
+    known = {
+        row["json_path"]: (row["mtime_ns"], row["size"])
+        for row in conn.execute("SELECT json_path, mtime_ns, size FROM transcripts")
+    }
+    parsed = {}
+    for json_path, stat in transcripts.items():
+        if known.pop(json_path, None) != (stat.st_mtime_ns, stat.st_size):
+            parsed[json_path] = index_transcript(conn, audio_folder, json_path, stat)
+
+    # Whatever is left was deleted or renamed on disk
+    for json_path in known:
+        remove_transcript(conn, json_path)
+
+    known = {
+        row["path"]: (row["size"], row["mtime_ns"], row["json_mtime_ns"])
+        for row in conn.execute("SELECT path, size, mtime_ns, json_mtime_ns FROM recordings")
+    }
+    for audio_path, stat in recordings.items():
+        json_path = transcript_path(audio_path)
+        json_stat = transcripts.get(json_path)
+        signature = (stat.st_size, stat.st_mtime_ns, json_stat.st_mtime_ns if json_stat is not None else None)
+        if known.pop(audio_path, None) != signature:
+            index_recording(conn, audio_folder, audio_path, stat, json_stat, parsed.get(json_path))
+
+    with conn:
+        conn.executemany("DELETE FROM recordings WHERE path = ?", ((path,) for path in known))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_refresh', ?)", (time.time(),))
+
+def is_stale(conn):
+    """Whether the archive was last scanned more than REFRESH_INTERVAL seconds ago, or never."""
+    row = conn.execute("SELECT value FROM meta WHERE key = 'last_refresh'").fetchone()
+    return row is None or abs(time.time() - row["value"]) > REFRESH_INTERVAL
+
+def refresh_if_stale(conn, audio_folder):
+    """Refresh the index unless it was scanned less than REFRESH_INTERVAL seconds ago.
+
+    The time of the last scan is kept in the index, so all processes share it.
+    While another thread or process is scanning, the index is used as it is.
+    """
+    if not is_stale(conn):
+        return
+    with refresh_lock(audio_folder, blocking=False) as acquired:
+        # Another scan may have finished between the check and the lock
+        if acquired and is_stale(conn):
+            _refresh(conn, audio_folder)
+
+def _match(query):
+    """SQL condition, its parameter and the result order selecting the segments that contain query."""
+    query = query.strip()
+    if len(query) >= 3:
+        # The trigram tokenizer turns a phrase query into a substring match; rank is bm25
+        return "segments MATCH ?", '"' + query.replace('"', '""') + '"', "rank, s.rowid"
+    # Too short for trigrams, fall back to a scan of the indexed text
+    pattern = '%' + _escape_like(query) + '%'
+    return "s.text LIKE ? ESCAPE '\\'", pattern, "s.rowid"
+
+def search(conn, query, limit=None, offset=0, file=None):
+    """Yield the segments containing query, best matches first.
+
+    limit and offset page through the results; file restricts them to one recording.
+    """
+    condition, param, order = _match(query)
+    params = [SEGMENT_STRIDE, SEGMENT_STRIDE, param]
+    if file is not None:
+        # A rowid range lets SQLite skip the segments of other transcripts
+        condition += (
+            " AND s.rowid BETWEEN (SELECT id FROM transcripts WHERE json_path = ?) * ?"
+            " AND (SELECT id FROM transcripts WHERE json_path = ?) * ? + ? - 1"
+        )
+        json_path = transcript_path(file)
+        params += [json_path, SEGMENT_STRIDE, json_path, SEGMENT_STRIDE, SEGMENT_STRIDE]
+    rows = conn.execute(
+        "SELECT t.json_path, s.rowid % ? AS segment, s.start, s.stop, s.text "
+        "FROM segments s JOIN transcripts t ON t.id = s.rowid / ? "
+        f"WHERE {condition} ORDER BY {order} LIMIT ? OFFSET ?",
+        (*params, -1 if limit is None else limit, offset)
+    )
+
+    for row in rows:
+        yield {
+            "file": row["json_path"].replace('.json', '.wav'),
+            "segment": row["segment"],
+            "start": row["start"],
+            "end": row["stop"],
+            "text": row["text"]
+        }
+
+def search_counts(conn, query):
+    """Number of segments containing query per recording, most hits first."""
+    condition, param, _ = _match(query)
+    rows = conn.execute(
+        "SELECT t.json_path, COUNT(*) AS hits "
+        "FROM segments s JOIN transcripts t ON t.id = s.rowid / ? "
+        f"WHERE {condition} GROUP BY t.id ORDER BY hits DESC, t.json_path",
+        (SEGMENT_STRIDE, param)
+    )
+    return [{"file": row["json_path"].replace('.json', '.wav'), "hits": row["hits"]} for row in rows]
+
+def catalog(conn):
+    """Return every recording with its metadata, plus totals over the archive."""
+    audio_files = [
+        {
+            "path": row["path"],
+            "size": row["size"],
+            "mtime": row["mtime_ns"] / 1e9,
+            "duration": row["duration"],
+            "date": row["date"],
+            "place": row["place"],
+            "has_transcript": row["json_mtime_ns"] is not None
+        }
+        for row in conn.execute("SELECT * FROM recordings ORDER BY path")
+    ]
+    totals = conn.execute(
+        "SELECT COUNT(*) AS files, COUNT(json_mtime_ns) AS transcribed, "
+        "COALESCE(SUM(duration), 0) AS duration, COALESCE(SUM(size), 0) AS size FROM recordings"
+    ).fetchone()
+    return {"audio_files": audio_files, "totals": dict(totals)}
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _folder_range(folder):
+    """Path prefix of a folder, with the SQL condition and parameters selecting the recordings below it."""
+    base = folder.strip('/') + '/' if folder.strip('/') else ''
+    if not base:
+        return base, "", []
+    # Every path below folder/ sorts between "folder/" and "folder0", so the primary key range applies
+    return base, "WHERE path >= ? AND path < ?", [base, base[:-1] + '0']
+
+def folder_totals(conn, folder=""):
+    """Number of recordings and transcripts, duration and size of everything below folder."""
+    _, condition, params = _folder_range(folder)
+    return dict(conn.execute(
+        "SELECT COUNT(*) AS files, COUNT(json_mtime_ns) AS transcribed, "
+        f"COALESCE(SUM(duration), 0) AS duration, COALESCE(SUM(size), 0) AS size FROM recordings {condition}",
+        params
+    ).fetchone())
+
+def tree(conn, folder="", prefix="", limit=None, offset=0):
+    """One level of the archive below folder: subfolders with aggregate counts, then recordings.
+
+    Subfolders carry the number of recordings and transcripts, duration and size
+    of everything below them. prefix keeps the entries whose name starts with it
+    (case-insensitively); limit and offset page through the entries.
+    """
+    base, condition, range_params = _folder_range(folder)
+    params = [len(base) + 1, *range_params]
+    rows = conn.execute(
+        "SELECT CASE WHEN slash > 0 THEN substr(rest, 1, slash - 1) ELSE rest END AS name, slash > 0 AS is_folder, "
+        "COUNT(*) AS files, COUNT(json_mtime_ns) AS transcribed, COALESCE(SUM(duration), 0) AS duration, "
+        "SUM(size) AS size, MAX(mtime_ns) AS mtime_ns, MAX(date) AS date, MAX(place) AS place "
+        "FROM (SELECT *, instr(rest, '/') AS slash FROM (SELECT *, substr(path, ?) AS rest FROM recordings "
+        f"{condition})) WHERE name LIKE ? ESCAPE '\\' "
+        "GROUP BY is_folder, name ORDER BY is_folder DESC, name LIMIT ? OFFSET ?",
+        (*params, _escape_like(prefix) + '%', -1 if limit is None else limit, offset)
+    )
+
+    entries = []
+    for row in rows:
+        entry = {"name": row["name"], "path": base + row["name"], "duration": row["duration"], "size": row["size"]}
+        if row["is_folder"]:
+            entry.update(type="folder", files=row["files"], transcribed=row["transcribed"])
+        else:
+            entry.update(
+                type="file", mtime=row["mtime_ns"] / 1e9, date=row["date"], place=row["place"],
+                has_transcript=row["transcribed"] > 0
+            )
+        entries.append(entry)
+    return entries
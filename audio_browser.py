@@ -1,84 +1,464 @@
 import os
+import sys
+import math
 import argparse
-from flask import Flask, jsonify, send_from_directory, render_template, request
+import threading
+import time
+import shutil
+import tempfile
+from contextlib import closing
+import subprocess
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, send_from_directory, send_file, render_template, request
+from werkzeug.security import safe_join
 import json
+import archive_index
+import annotation_journal
+import transcription_queue
+import export
+from transcript_cache import TranscriptCache, DEFAULT_MAX_BYTES as TRANSCRIPT_CACHE_BYTES
+from jsonfile import content_etag, locked, write_json
+import transcode_cache
+import peaks
+import words
+from wavfile import WavError, read_header
+from metrics import Metrics
 
-app = Flask(__name__)
+bp = Blueprint('audio_browser', __name__)
 
-parser = argparse.ArgumentParser(description="Set the path to the audio folder")
-parser.add_argument(
-    '--audio-folder', 
-    type=str, 
-    required=True, 
-    help="The path to the folder containing the audio files"
-)
+def create_app(
+    audio_folder,
+    transcode_cache_mb=transcode_cache.DEFAULT_MAX_BYTES // 1024 ** 2,
+    transcript_cache_mb=TRANSCRIPT_CACHE_BYTES // 1024 ** 2,
+    background=True,
+    metrics_dir=None
+):
+    """Build the browser app for one audio folder.
 
-args = parser.parse_args()
-AUDIO_FOLDER = args.audio_folder
+    With background=True this process also builds the archive index and compacts
+    the annotation journal; --serve runs those jobs once, in a separate process.
+    Processes given the same metrics_dir report their metrics together.
+    """
+    app = Flask(__name__)
+    app.config['AUDIO_FOLDER'] = audio_folder
+    app.config['TRANSCODE_CACHE_BYTES'] = transcode_cache_mb * 1024 ** 2
+    # Parsed, encoded (and gzipped) /transcription payloads, per process
+    app.extensions['transcript_cache'] = TranscriptCache(transcript_cache_mb * 1024 ** 2)
+    # Request counters and latency histograms served at /metrics
+    metrics = Metrics(directory=metrics_dir)
+    metrics.collectors.append(collect_transcript_cache_stats(app.extensions['transcript_cache']))
+    app.extensions['metrics'] = metrics
+    app.register_blueprint(bp)
+    if background:
+        start_background_jobs(audio_folder)
+    return app
 
-@app.route('/')
+def collect_transcript_cache_stats(cache):
+    def collect(metrics):
+        stats = cache.stats()
+        metrics.set("audio_browser_transcript_cache_hits_total", "Transcription cache hits.", (), stats["hits"], kind="counter")
+        metrics.set("audio_browser_transcript_cache_misses_total", "Transcription cache misses.", (), stats["misses"], kind="counter")
+        metrics.set("audio_browser_transcript_cache_entries", "Transcriptions in the cache.", (), stats["entries"])
+        metrics.set("audio_browser_transcript_cache_bytes", "Size of the cached transcriptions.", (), stats["bytes"])
+    return collect
+
+def index_connection():
+    # This thread's connection to the archive index, kept open between requests
+    return archive_index.thread_connection(current_app.config['AUDIO_FOLDER'])
+
+def transcript_cache():
+    return current_app.extensions['transcript_cache']
+
+def stage(name):
+    # Time a part of request handling into the stage histogram of /metrics
+    return current_app.extensions['metrics'].time_stage(name)
+
+def start_background_jobs(audio_folder):
+    # Build the index in the background instead of on the first request
+    threading.Thread(target=build_archive_index, args=(audio_folder,), daemon=True).start()
+    # Fold journaled annotations and notes into the sidecars every so often
+    threading.Thread(target=annotation_journal.compact_forever, args=(audio_folder,), daemon=True).start()
+
+def run_background_jobs(audio_folder):
+    # Body of the background process started by --serve
+    threading.Thread(target=build_archive_index, args=(audio_folder,), daemon=True).start()
+    annotation_journal.compact_forever(audio_folder)
+
+def reindex_transcription(transcription_filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # Keep the search index and catalog in sync with a sidecar we just rewrote
+    transcript_cache().invalidate(os.path.normpath(transcription_filename))
+    conn = index_connection()
+    archive_index.update_transcript(conn, audio_folder, os.path.normpath(transcription_filename))
+
+def build_archive_index(audio_folder):
+    with closing(archive_index.connect(audio_folder)) as conn:
+        archive_index.refresh(conn, audio_folder)
+        audio_files = archive_index.catalog(conn)["audio_files"]
+    # Then precompute waveform peaks for recordings that have none yet
+    peaks.generate_missing(os.path.join(audio_folder, entry["path"]) for entry in audio_files)
+
+@bp.route('/')
 def index():
     # Serve the index.html file from the templates folder
     return render_template('index.html')
 
-@app.route('/list_audio_files')
+def load_catalog():
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    conn = index_connection()
+    # Only files whose mtime changed since the last scan are re-read
+    with stage("index_refresh"):
+        archive_index.refresh_if_stale(conn, audio_folder)
+    with stage("catalog_query"):
+        return archive_index.catalog(conn)
+
+@bp.route('/list_audio_files')
 def list_audio_files():
-    # List to store the paths of audio files
-    audio_files = []
-    
-    # Walk through the AUDIO_FOLDER and collect all .wav files
-    for root, dirs, files in os.walk(AUDIO_FOLDER):
-        for file in files:
-            if file.endswith(".wav"):
-                # Add the relative file path to the list
-                audio_files.append(os.path.relpath(os.path.join(root, file), AUDIO_FOLDER))
-    
-    # Return the list of audio files as a JSON response
-    return jsonify({"audio_files": audio_files})
+    # Return the relative paths of all .wav files as a JSON response
+    catalog = load_catalog()
+    return jsonify({"audio_files": [entry["path"] for entry in catalog["audio_files"]]})
+
+@bp.route('/catalog')
+def serve_catalog():
+    # All recordings with their metadata plus archive totals, in one response
+    return jsonify(load_catalog())
 
-@app.route('/audio/<path:filename>')
+# Tree entries per page, by default and at most
+TREE_PAGE_SIZE = 200
+MAX_TREE_PAGE_SIZE = 1000
+
+@bp.route('/tree')
+def serve_tree():
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # One level of the archive below ?folder= (the root by default): subfolders with
+    # their recording counts, durations and sizes, then recordings. ?prefix= keeps
+    # names starting with it; limit and cursor page through the entries like search.
+    # The first page also carries the totals of the folder.
+    folder = request.args.get('folder', '').strip('/')
+    prefix = request.args.get('prefix', '')
+    try:
+        limit = min(int(request.args.get('limit', TREE_PAGE_SIZE)), MAX_TREE_PAGE_SIZE)
+        cursor = int(request.args.get('cursor', 0))
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+    if limit < 1 or cursor < 0:
+        return jsonify({"error": "limit must be positive and cursor not negative"}), 400
+    if '..' in folder.split('/'):
+        return jsonify({"error": "Invalid folder"}), 400
+
+    conn = index_connection()
+    # The catalog is the cached scan; only files whose mtime changed are re-read
+    with stage("index_refresh"):
+        archive_index.refresh_if_stale(conn, audio_folder)
+    with stage("tree_query"):
+        # Ask for one extra entry to know whether there is a next page
+        entries = archive_index.tree(conn, folder, prefix, limit + 1, cursor)
+        response = {
+            "folder": folder,
+            "entries": entries[:limit],
+            "next_cursor": cursor + limit if len(entries) > limit else None
+        }
+        if cursor == 0:
+            response["totals"] = archive_index.folder_totals(conn, folder)
+    return jsonify(response)
+
+@bp.route('/queue')
+def queue_status():
+    # Jobs of the transcription queue filled by watch_folder.py: running and queued
+    # ones with the seconds until they are done, then recently finished ones
+    conn = index_connection()
+    return jsonify({"jobs": transcription_queue.jobs(conn)})
+
+@bp.route('/queue/<path:filename>')
+def queue_job(filename):
+    audio_path = os.path.normpath(filename)
+    conn = index_connection()
+    for job in transcription_queue.jobs(conn):
+        if job["file"] == audio_path:
+            return jsonify(job)
+    return jsonify({"error": "Not queued"}), 404
+
+@bp.route('/queue/<path:filename>', methods=['POST'])
+def request_transcription(filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # Put a recording at the front of the queue, behind other requested ones
+    source_path = safe_join(audio_folder, filename)
+    if source_path is None or not os.path.isfile(source_path):
+        return jsonify({"error": "Audio file not found"}), 404
+    if os.path.exists(archive_index.transcript_path(source_path)):
+        return jsonify({"error": "Already transcribed"}), 409
+    try:
+        duration = read_header(source_path).duration
+    except WavError as e:
+        return jsonify({"error": f"Cannot transcribe: {str(e)}"}), 400
+
+    audio_path = os.path.normpath(filename)
+    conn = index_connection()
+    transcription_queue.enqueue(conn, audio_path, duration, requested=True)
+    job = next(job for job in transcription_queue.jobs(conn) if job["file"] == audio_path)
+    return jsonify(job), 202
+
+@bp.route('/audio/<path:filename>')
 def serve_audio(filename):
-    # Serve the audio file from the AUDIO_FOLDER
-    return send_from_directory(AUDIO_FOLDER, filename)
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # Serve the audio file from the audio_folder, or a cached compressed
+    # transcode of it with ?format=opus or ?format=aac. Both support byte
+    # ranges for seeking and ETag/Last-Modified revalidation.
+    fmt = request.args.get('format')
+    if not fmt:
+        return send_from_directory(audio_folder, filename, conditional=True, etag=True, max_age=0)
+
+    if fmt not in transcode_cache.FORMATS:
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+
+    source_path = safe_join(audio_folder, filename)
+    if source_path is None or not os.path.isfile(source_path):
+        return jsonify({"error": "Audio file not found"}), 404
+
+    try:
+        transcode_path = transcode_cache.cached_transcode(audio_folder, source_path, fmt, current_app.config['TRANSCODE_CACHE_BYTES'])
+    except subprocess.CalledProcessError as e:
+        return jsonify({"error": f"Error transcoding audio: {e.stderr.decode(errors='replace').strip()}"}), 500
+
+    return send_file(
+        transcode_path,
+        mimetype=transcode_cache.FORMATS[fmt][1],
+        conditional=True,
+        etag=True,
+        max_age=0
+    )
 
-@app.route('/transcription/<path:audio_filename>')
+@bp.route('/peaks/<path:filename>')
+def serve_peaks(filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # Min/max waveform peaks of one resolution level (?zoom=, 0 is finest, or
+    # ?width= to pick the level) over an optional ?start=&end= window in seconds
+    audio_path = safe_join(audio_folder, filename)
+    if audio_path is None or not os.path.isfile(audio_path):
+        return jsonify({"error": "Audio file not found"}), 404
+
+    try:
+        peaks_file = peaks.ensure_peaks(audio_path)
+        return jsonify(peaks.read_peaks(
+            peaks_file,
+            zoom=request.args.get('zoom', type=int),
+            width=request.args.get('width', type=int),
+            start=request.args.get('start', 0.0, type=float),
+            end=request.args.get('end', type=float)
+        )), 200
+    except (WavError, ValueError) as e:
+        # Not a WAV file, or one the peak reader cannot map
+        return jsonify({"error": f"No peaks for this file: {str(e)}"}), 415
+    except OSError as e:
+        return jsonify({"error": f"Error reading peaks: {str(e)}"}), 500
+
+@bp.route('/words/<path:audio_filename>')
+def serve_words(audio_filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # Word timings of the segments ?start= to ?end= (exclusive, segment indexes),
+    # from the .words sidecar written by the transcribe scripts with --word-timestamps
+    words_file = safe_join(audio_folder, words.words_path(audio_filename))
+    if words_file is None or not os.path.isfile(words_file):
+        return jsonify({"error": "No word timings for this recording"}), 404
+
+    try:
+        data = words.read_words(
+            words_file,
+            request.args.get('start', 0, type=int),
+            request.args.get('end', type=int)
+        )
+    except (OSError, ValueError) as e:
+        return jsonify({"error": f"Error reading word timings: {str(e)}"}), 500
+    response = jsonify(data)
+    stat = os.stat(words_file)
+    response.set_etag(f"{stat.st_mtime_ns}-{stat.st_size}")
+    return response.make_conditional(request)
+
+@bp.route('/transcription/<path:audio_filename>')
 def serve_transcription(audio_filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
     # Extract the base name of the audio file to find the json
     transcription_filename = audio_filename.replace(".wav", ".json")
 
-    # Ensure the transcription file exists
-    transcription_path = os.path.join(AUDIO_FOLDER, transcription_filename)
-    
-    if os.path.exists(transcription_path):
-        # If the transcription file exists, return the transcription as a JSON response
-        with open(transcription_path, 'r') as file:
-            transcription_data = json.load(file)  # Load the entire JSON
-        return jsonify(transcription_data), 200
-    else:
+    # Ensure the transcription file exists, inside the audio folder
+    transcription_path = safe_join(audio_folder, transcription_filename)
+    if transcription_path is None:
         return jsonify({"error": "Transcription not found"}), 404
 
-@app.route('/update_transcription/<path:audio_filename>', methods=['POST'])
+    try:
+        stat = os.stat(transcription_path)
+    except FileNotFoundError:
+        return jsonify({"error": "Transcription not found"}), 404
+
+    json_path = os.path.normpath(transcription_filename)
+    conn = index_connection()
+    # Any change to the file or to its journal gives a new cache key
+    key = (stat.st_mtime_ns, stat.st_size, annotation_journal.last_id(conn, json_path))
+    cached = transcript_cache().get(json_path, key)
+    if cached is None:
+        with stage("json_parse"):
+            with open(transcription_path, 'r') as file:
+                transcription_data = json.load(file)  # Load the entire JSON
+
+        # Add annotations and notes still waiting in the journal
+        with stage("journal_merge"):
+            annotation_journal.merge(transcription_data, annotation_journal.pending(conn, json_path))
+
+        # The ETag covers the segments only: it is the version segment PATCHes must
+        # match, and journal compaction must not invalidate it
+        with stage("json_encode"):
+            cached = transcript_cache().put(
+                json_path, key,
+                current_app.json.dumps(transcription_data).encode('utf-8'),
+                content_etag(transcription_data.get('transcript'))
+            )
+
+    body, gzipped, transcript_etag = cached
+    response = Response(body, status=200, mimetype='application/json')
+    response.headers['ETag'] = transcript_etag
+    response.vary.add('Accept-Encoding')
+    if gzipped is not None and 'gzip' in request.accept_encodings:
+        response.set_data(gzipped)
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@bp.route('/export/<path:filename>')
+def serve_export(filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # A transcription as subtitles or text, rendered from its .json on request:
+    # /export/<file>.srt, .vtt or .txt, as a download with ?download=1
+    base, ext = os.path.splitext(filename)
+    fmt = ext[1:]
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"Unknown export format: {ext}"}), 400
+
+    transcription_path = safe_join(audio_folder, base + '.json')
+    if transcription_path is None or not os.path.isfile(transcription_path):
+        return jsonify({"error": "Transcription not found"}), 404
+
+    try:
+        stat = os.stat(transcription_path)
+        with open(transcription_path, 'r', encoding='utf-8') as file:
+            transcription_data = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        return jsonify({"error": f"Error reading transcription: {str(e)}"}), 500
+
+    # The same check as export.py on the command line
+    try:
+        segments = export.transcript_segments(transcription_data, base + '.json')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 422
+    body = export.render(segments, fmt)
+    response = Response(body, content_type=f"{export.FORMATS[fmt][0]}; charset=utf-8")
+    response.set_etag(f"{stat.st_mtime_ns}-{stat.st_size}")
+    if request.args.get('download') == '1':
+        response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(filename)}"'
+    return response.make_conditional(request)
+
+@bp.route('/transcription_cache_stats')
+def transcription_cache_stats():
+    # Hit/miss counters and size of the /transcription cache of this process
+    return jsonify(transcript_cache().stats())
+
+def is_number(value):
+    # bool is an int subclass, and NaN or infinity cannot be stored as JSON
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def invalid_segment_change(changes):
+    """Describe the first malformed segment change of a PATCH, or return None if all are valid."""
+    for change in changes:
+        if not isinstance(change, dict):
+            return f"Segment changes must be objects, got: {json.dumps(change)}"
+        index = change.get('index')
+        if not isinstance(index, int) or isinstance(index, bool):
+            return f"Invalid segment index: {json.dumps(index)}"
+        for field in ('start', 'end'):
+            if field in change and not is_number(change[field]):
+                return f"Segment {index}: {field} must be a number"
+        if 'text' in change and not isinstance(change['text'], str):
+            return f"Segment {index}: text must be a string"
+    return None
+
+@bp.route('/transcription/<path:audio_filename>', methods=['PATCH'])
+def patch_transcription(audio_filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # Update individual segments, sent as {"segments": [{"index": i, "text": ...}, ...]}.
+    # The If-Match header must carry the ETag the client last saw, so concurrent
+    # editors (or a re-transcription) cannot silently be overwritten.
+    transcription_filename = audio_filename.replace(".wav", ".json")
+    transcription_path = safe_join(audio_folder, transcription_filename)
+
+    if transcription_path is None or not os.path.exists(transcription_path):
+        return jsonify({"error": "Transcription file not found"}), 404
+
+    expected = request.headers.get('If-Match')
+    if not expected:
+        return jsonify({"error": "If-Match header with the transcription ETag is required"}), 428
+
+    changes = (request.json or {}).get('segments')
+    if not isinstance(changes, list):
+        return jsonify({"error": "Expected a list of segments"}), 400
+    problem = invalid_segment_change(changes)
+    if problem:
+        return jsonify({"error": problem}), 400
+
+    try:
+        with locked(transcription_path):
+            with open(transcription_path, 'r') as file:
+                existing_data = json.load(file)
+            transcript = existing_data.get('transcript', [])
+
+            current = content_etag(transcript)
+            if expected != current:
+                return jsonify({"error": "Transcription was modified by someone else"}), 412, {"ETag": current}
+
+            updated = {}
+            for change in changes:
+                index = change['index']
+                if not 0 <= index < len(transcript) or not isinstance(transcript[index], dict):
+                    return jsonify({"error": f"Invalid segment index: {index}"}), 400
+                for field in ('start', 'end', 'text'):
+                    if field in change:
+                        transcript[index][field] = change[field]
+                updated[index] = transcript[index]
+
+            write_json(transcription_path, existing_data)
+            new_etag = content_etag(transcript)
+
+        transcript_cache().invalidate(os.path.normpath(transcription_filename))
+        conn = index_connection()
+        archive_index.update_segments(conn, audio_folder, os.path.normpath(transcription_filename), updated)
+
+        return jsonify({"message": "Transcription updated successfully"}), 200, {"ETag": new_etag}
+    except Exception as e:
+        return jsonify({"error": f"Error saving transcription: {str(e)}"}), 500
+
+@bp.route('/update_transcription/<path:audio_filename>', methods=['POST'])
 def update_transcription(audio_filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
     # Find the json
     transcription_filename = audio_filename.replace(".wav", ".json")
 
-    transcription_path = os.path.join(AUDIO_FOLDER, transcription_filename)
+    transcription_path = safe_join(audio_folder, transcription_filename)
 
-    if os.path.exists(transcription_path):
+    if transcription_path is not None and os.path.exists(transcription_path):
         # Get the updated transcription data from the request
         updated_transcription = request.json.get('transcription')
 
         # Read the existing data to keep other fields intact
         try:
-            with open(transcription_path, 'r') as file:
-                existing_data = json.load(file)
-            
-            # Update the transcription part with the new transcription
-            existing_data['transcript'] = updated_transcription
+            with locked(transcription_path):
+                with open(transcription_path, 'r') as file:
+                    existing_data = json.load(file)
 
-            # Write the updated data back to the file
-            with open(transcription_path, 'w') as file:
-                json.dump(existing_data, file, indent=4)
+                # Update the transcription part with the new transcription
+                existing_data['transcript'] = updated_transcription
+
+                # Write the updated data back to the file, atomically
+                write_json(transcription_path, existing_data)
+                # Its word timings are indexed by segment, and the segments were replaced
+                words.remove_words(transcription_path)
+
+            reindex_transcription(transcription_filename)
             
             return jsonify({"message": "Transcription updated successfully"}), 200
         except Exception as e:
@@ -86,94 +466,251 @@ def update_transcription(audio_filename):
     else:
         return jsonify({"error": "Transcription file not found"}), 404
 
-@app.route('/add_annotation/<path:audio_filename>', methods=['POST'])
+@bp.route('/add_annotation/<path:audio_filename>', methods=['POST'])
 def add_annotation(audio_filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
     # Find json
     transcription_filename = audio_filename.replace(".wav", ".json")
 
-    transcription_path = os.path.join(AUDIO_FOLDER, transcription_filename)
+    transcription_path = safe_join(audio_folder, transcription_filename)
 
-    if os.path.exists(transcription_path):
+    if transcription_path is not None and os.path.exists(transcription_path):
         # Get the annotation data from the request
         new_annotation = request.json.get('annotation')
 
-        # Read the existing data to keep other fields intact
+        # Append to the journal instead of rewriting the sidecar; it is merged
+        # on read and compacted into the file in the background
         try:
-            with open(transcription_path, 'r') as file:
-                existing_data = json.load(file)
-            
-            # Add the new annotation to the annotations field
-            if 'annotations' not in existing_data:
-                existing_data['annotations'] = []  # Initialize if the field doesn't exist
+            conn = index_connection()
+            annotation_journal.append(conn, os.path.normpath(transcription_filename), "annotation", new_annotation)
+            transcript_cache().invalidate(os.path.normpath(transcription_filename))
 
-            existing_data['annotations'].append(new_annotation)
-
-            # Write the updated data back to the file
-            with open(transcription_path, 'w') as file:
-                json.dump(existing_data, file, indent=4)
-            
             return jsonify({"message": "Annotation added successfully"}), 200
         except Exception as e:
             return jsonify({"error": f"Error saving annotation: {str(e)}"}), 500
     else:
         return jsonify({"error": "Transcription file not found"}), 404
     
-@app.route('/update_notes/<path:audio_filename>', methods=['POST'])
+@bp.route('/update_notes/<path:audio_filename>', methods=['POST'])
 def update_notes(audio_filename):
+    audio_folder = current_app.config['AUDIO_FOLDER']
     transcription_filename = audio_filename.replace(".wav", ".json")
-    transcription_path = os.path.join(AUDIO_FOLDER, transcription_filename)
+    transcription_path = safe_join(audio_folder, transcription_filename)
 
-    if os.path.exists(transcription_path):
+    if transcription_path is not None and os.path.exists(transcription_path):
         new_notes = request.json.get('notes')
 
         try:
-            with open(transcription_path, 'r') as file:
-                existing_data = json.load(file)
-            
-            existing_data['notes'] = new_notes  # Update the notes field
+            conn = index_connection()
+            annotation_journal.append(conn, os.path.normpath(transcription_filename), "notes", new_notes)
+            transcript_cache().invalidate(os.path.normpath(transcription_filename))
 
-            with open(transcription_path, 'w') as file:
-                json.dump(existing_data, file, indent=4)
-            
             return jsonify({"message": "Notes updated successfully"}), 200
         except Exception as e:
             return jsonify({"error": f"Error saving notes: {str(e)}"}), 500
     else:
         return jsonify({"error": "Transcription file not found"}), 404
     
-@app.route('/search_transcripts', methods=['GET'])
+# Search results per page, by default and at most
+SEARCH_PAGE_SIZE = 100
+MAX_SEARCH_PAGE_SIZE = 1000
+
+@bp.route('/search_transcripts', methods=['GET'])
 def search_transcripts():
-    query = request.args.get('q', '').lower()
-    if not query:
-        return jsonify([])
-
-    results = []
-
-    for root, _, files in os.walk(AUDIO_FOLDER):
-        for file_name in files:
-            if file_name.startswith('._'):
-                continue
-
-            if file_name.endswith('.json'):
-                file_path = os.path.join(root, file_name)
-                try:
-                    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                        data = json.load(f)
-                except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                    print(f"Skipping invalid JSON file {file_path}: {e}")
-                    continue
-
-                if "transcript" in data:
-                    for segment in data["transcript"]:
-                        if query in segment["text"].lower():
-                            results.append({
-                                "file": os.path.relpath(file_path, AUDIO_FOLDER).replace('.json', '.wav'),
-                                "start": segment["start"],
-                                "end": segment["end"],
-                                "text": segment["text"]
-                            })
-
-    return jsonify(results)
+    audio_folder = current_app.config['AUDIO_FOLDER']
+    # One page of results, best matches first. The page ends with a summary holding
+    # the cursor of the next page and, on the first page, the hit count per file.
+    # With stream=1 the page is sent as NDJSON, one result per line, summary last.
+    query = request.args.get('q', '').strip()
+    file = request.args.get('file') or None
+    stream = request.args.get('stream') == '1' or request.accept_mimetypes.best == 'application/x-ndjson'
+    try:
+        limit = min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), MAX_SEARCH_PAGE_SIZE)
+        cursor = int(request.args.get('cursor', 0))
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+    if limit < 1 or cursor < 0:
+        return jsonify({"error": "limit must be positive and cursor not negative"}), 400
+
+    if query:
+        conn = index_connection()
+        # Pick up sidecars written by the transcription scripts since the last scan
+        with stage("index_refresh"):
+            archive_index.refresh_if_stale(conn, audio_folder)
+
+    def search_page():
+        if not query:
+            yield {"next_cursor": None, "files": [], "total": 0}
+            return
+        # Streamed pages run outside the app context, so not index_connection()
+        conn = archive_index.thread_connection(audio_folder)
+        # Ask for one extra row to know whether there is a next page
+        returned = 0
+        more = False
+        for result in archive_index.search(conn, query, limit + 1, cursor, file):
+            if returned == limit:
+                more = True
+                break
+            returned += 1
+            yield result
+
+        summary = {"next_cursor": cursor + limit if more else None}
+        if cursor == 0:
+            files = archive_index.search_counts(conn, query)
+            if file is not None:
+                files = [entry for entry in files if entry["file"] == file]
+            summary["files"] = files
+            summary["total"] = sum(entry["hits"] for entry in files)
+        yield summary
+
+    if stream:
+        # The body is produced after the request context is gone
+        dumps = current_app.json.dumps
+        lines = (dumps(item) + "\n" for item in search_page())
+        return Response(lines, mimetype='application/x-ndjson')
+
+    *results, summary = search_page()
+    return jsonify({"results": results, **summary})
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def observe_request(response):
+    # Routes are labelled by their rule, not the path, so every file shares one series
+    metrics = current_app.extensions['metrics']
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    method = request.method
+    status = str(response.status_code)
+    started = g.request_started
+
+    def record():
+        # Runs once the body is sent, so streamed and file responses are timed in full
+        metrics.inc("audio_browser_requests_total", "HTTP requests handled.", (("route", route), ("method", method), ("status", status)))
+        metrics.observe(
+            "audio_browser_request_duration_seconds", "Time to handle an HTTP request, including sending the body.",
+            (("route", route), ("method", method)), time.perf_counter() - started
+        )
+
+    if response.direct_passthrough:
+        # File responses skip close callbacks (wrapping them would defeat sendfile);
+        # they are timed up to the start of sending
+        record()
+    else:
+        response.call_on_close(record)
+    return response
+
+@bp.route('/metrics')
+def serve_metrics():
+    # Prometheus text format. Under --serve the workers' metrics are added up.
+    lines = current_app.extensions['metrics'].render()
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+def serve(args):
+    """Run the app under gunicorn: several worker processes with threads each."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        # Exit with an error, so supervisors do not take this for a clean stop
+        sys.exit("--serve needs gunicorn, install it with: pip install gunicorn")
+
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread",
+        "timeout": args.timeout,
+        "keepalive": args.keep_alive,
+        # Whole audio files are sent by the kernel with sendfile(2)
+        "sendfile": True,
+    }
+
+    class AudioBrowserServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Called in every worker after it is forked
+            return create_app(
+                args.audio_folder, args.transcode_cache_mb, args.transcript_cache_mb,
+                background=False, metrics_dir=metrics_dir
+            )
+
+    # Index builds and journal compaction run once for all workers, in their own
+    # process. It is not a multiprocessing child: the workers forked from this
+    # process would try to stop it when they exit.
+    jobs = subprocess.Popen(
+        [sys.executable, "-c", "import sys, audio_browser; audio_browser.run_background_jobs(sys.argv[1])", args.audio_folder],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    # Every worker writes its metrics here, and /metrics adds them up
+    metrics_dir = tempfile.mkdtemp(prefix="audio_browser_metrics.")
+    master_pid = os.getpid()
+    print(f"Serving {args.audio_folder} on {args.bind} with {args.workers} worker(s), {args.threads} thread(s) each")
+    try:
+        AudioBrowserServer().run()
+    finally:
+        # Exiting workers unwind through here too
+        if os.getpid() == master_pid:
+            jobs.terminate()
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Set the path to the audio folder")
+    parser.add_argument(
+        '--audio-folder', 
+        type=str, 
+        required=True, 
+        help="The path to the folder containing the audio files"
+    )
+    parser.add_argument(
+        '--transcode-cache-mb',
+        type=int,
+        default=transcode_cache.DEFAULT_MAX_BYTES // 1024 ** 2,
+        help="Size limit of the on-disk cache of compressed audio transcodes, in MB"
+    )
+    parser.add_argument(
+        '--transcript-cache-mb',
+        type=int,
+        default=TRANSCRIPT_CACHE_BYTES // 1024 ** 2,
+        help="Size limit of the in-memory cache of encoded transcriptions, in MB"
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help="Run the production server (gunicorn) instead of the development server"
+    )
+    parser.add_argument('--bind', default="127.0.0.1:5000", help="Address to listen on with --serve (default: 127.0.0.1:5000)")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Worker processes with --serve (default: CPU cores, at most 4)"
+    )
+    parser.add_argument('--threads', type=int, default=8, help="Threads per worker with --serve (default: 8)")
+    parser.add_argument(
+        '--timeout',
+        type=int,
+        default=120,
+        help="Seconds before a stuck worker is restarted with --serve (default: 120)"
+    )
+    parser.add_argument(
+        '--keep-alive',
+        type=int,
+        default=5,
+        help="Seconds to keep idle connections open with --serve (default: 5)"
+    )
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    args = parse_args()
+    if args.serve:
+        serve(args)
+    else:
+        # Development server, with the reloader and debugger. The reloader runs this
+        # script twice; only the child it starts serves, and runs the background jobs
+        serving = os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+        app = create_app(args.audio_folder, args.transcode_cache_mb, args.transcript_cache_mb, background=serving)
+        app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import wave
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import closing
+
+import numpy as np
+
+# The benchmark drives the modules of the repository root
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import archive_index
+
+SAMPLE_RATE = 16000
+
+PLACES = ["Graz", "Wien", "Berlin", "Basel", "Linz", "Zuerich", "Leipzig", "Salzburg"]
+WORDS = (
+    "und die der das ist nicht ein zu wir ich es mit auf dann aber noch so also jetzt "
+    "klang raum stimme probe aufnahme mikrofon stille pause takt rhythmus ton frequenz "
+    "wiederholen langsam schneller lauter leiser anfang ende teil szene text bewegung"
+).split()
+
+def make_wav(path, seconds, rng):
+    """Write a mono 16-bit WAV of low-level noise."""
+    samples = (rng.standard_normal(int(seconds * SAMPLE_RATE)) * 300).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+
+def make_transcript(rng, minutes):
+    """Segments shaped like Whisper output: about 20 per minute, 5 to 25 words each."""
+    segments = []
+    t = 0.0
+    while t < minutes * 60:
+        length = rng.uniform(1.5, 6.0)
+        text = " " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 25)))
+        segments.append({"start": round(t, 2), "end": round(t + length, 2), "text": text})
+        t += length
+    return segments
+
+def make_archive(folder, files, minutes, wav_seconds, seed=0):
+    """Fill folder with files recordings, each with a .json sidecar covering minutes of speech.
+
+    The WAVs themselves are only wav_seconds long; the endpoints never decode them.
+    """
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(files):
+        subfolder = os.path.join(folder, f"{2019 + i % 5}")
+        os.makedirs(subfolder, exist_ok=True)
+        date = f"{19 + i % 5:02}{1 + i % 12:02}{1 + i % 28:02}"
+        name = f"{date}_{PLACES[i % len(PLACES)]}_Probe{i:04}"
+        wav_path = os.path.join(subfolder, name + ".wav")
+        make_wav(wav_path, wav_seconds, noise)
+        with open(os.path.join(subfolder, name + ".json"), "w") as f:
+            json.dump({
+                "path": wav_path,
+                "duration": minutes,
+                "date": date,
+                "place": PLACES[i % len(PLACES)],
+                "notes": f"Probe{i:04}",
+                "transcript": make_transcript(rng, minutes)
+            }, f, indent=4)
+        paths.append(os.path.relpath(wav_path, folder))
+    return paths
+
+def summarize(timings):
+    """Latency statistics in milliseconds, plus requests per second."""
+    ms = np.array(timings) * 1000
+    return {
+        "n": len(timings),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "min_ms": round(float(ms.min()), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "per_second": round(len(timings) / float(sum(timings)), 2)
+    }
+
+def timed(client, method, url, repeat, expect=200, **kwargs):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        timings.append(time.perf_counter() - start)
+        if response.status_code != expect:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return summarize(timings)
+
+def bench_endpoints(folder, paths, repeat):
+    """Latency of the browser endpoints, through Flask's test client (no network)."""
+    from audio_browser import create_app
+
+    results = {}
+    start = time.perf_counter()
+    with closing(archive_index.connect(folder)) as conn:
+        archive_index.refresh(conn, folder)
+    results["index_build_s"] = round(time.perf_counter() - start, 3)
+
+    app = create_app(folder, background=False)
+    client = app.test_client()
+    first = paths[0]
+    json_file = first.replace(".wav", ".json")
+
+    results["list_audio_files"] = timed(client, "GET", "/list_audio_files", repeat)
+    results["catalog"] = timed(client, "GET", "/catalog", repeat)
+    results["tree_root"] = timed(client, "GET", "/tree", repeat)
+    results["tree_folder"] = timed(client, "GET", f"/tree?folder={os.path.dirname(first)}", repeat)
+    results["search_common"] = timed(client, "GET", "/search_transcripts?q=und", repeat)
+    results["search_rare"] = timed(client, "GET", "/search_transcripts?q=frequenz%20wiederholen", repeat)
+    results["search_short"] = timed(client, "GET", "/search_transcripts?q=zu", repeat)
+    results["search_stream"] = timed(client, "GET", "/search_transcripts?q=und&stream=1&limit=1000", repeat)
+
+    # One cold read per file, then repeated reads of the same file
+    timings = []
+    for path in paths[1:repeat + 1] or paths:
+        start = time.perf_counter()
+        client.get(f"/transcription/{path}")
+        timings.append(time.perf_counter() - start)
+    results["transcription_cold"] = summarize(timings)
+    results["transcription_warm"] = timed(client, "GET", f"/transcription/{first}", repeat)
+    results["transcription_warm_gzip"] = timed(
+        client, "GET", f"/transcription/{first}", repeat, headers={"Accept-Encoding": "gzip"}
+    )
+
+    timings = []
+    for i in range(repeat):
+        etag = client.get(f"/transcription/{first}").headers["ETag"]
+        start = time.perf_counter()
+        response = client.patch(
+            f"/transcription/{json_file}",
+            json={"segments": [{"index": i % 10, "text": f" bearbeitet {i}"}]},
+            headers={"If-Match": etag}
+        )
+        timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"PATCH returned {response.status_code}")
+    results["patch_segment"] = summarize(timings)
+
+    results["add_annotation"] = timed(
+        client, "POST", f"/add_annotation/{json_file}", repeat,
+        json={"annotation": {"start": 1.0, "end": 2.0, "text": "Notiz"}}
+    )
+    results["update_notes"] = timed(client, "POST", f"/update_notes/{json_file}", repeat, json={"notes": "Benchmark"})
+
+    with open(os.path.join(folder, json_file)) as f:
+        transcript = json.load(f)["transcript"]
+    results["update_transcription"] = timed(
+        client, "POST", f"/update_transcription/{json_file}", repeat, json={"transcription": transcript}
+    )
+    return results
+
+def bench_transcription(audio_path, model_name, seconds):
+    """Real-time factor of the transcription path: processing time per second of audio.
+
+    Audio is transcribed window by window with a checkpoint, as the transcribe
+    scripts do, so the factor matches real runs.
+    """
+    from transcriber import Transcriber, checkpoint_path, load_audio
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if audio_path is None:
+            audio_path = os.path.join(tmp, "noise.wav")
+            make_wav(audio_path, seconds, np.random.default_rng(0))
+
+        start = time.perf_counter()
+        audio, duration = load_audio(audio_path)
+        decode_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        transcriber = Transcriber(model_name, device="cpu")
+        transcriber.load()
+        load_s = time.perf_counter() - start
+        # Speeds measured on generated audio stay out of the ETA statistics
+        transcriber.throughput_key = None
+
+        with transcriber:
+            start = time.perf_counter()
+            transcriber.transcribe(audio, checkpoint=checkpoint_path(os.path.join(tmp, "benchmark.json")))
+            transcribe_s = time.perf_counter() - start
+
+    return {
+        "model": model_name,
+        "audio_s": round(duration, 3),
+        "decode_s": round(decode_s, 3),
+        "model_load_s": round(load_s, 3),
+        "transcribe_s": round(transcribe_s, 3),
+        "real_time_factor": round(transcribe_s / duration, 4),
+        "audio_s_per_s": round(duration / transcribe_s, 3)
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(previous, current):
+    """Print the change of every latency and rate between two result files."""
+    for group in ("endpoints", "transcription"):
+        old_group = previous.get(group) or {}
+        for name, value in (current.get(group) or {}).items():
+            old = old_group.get(name)
+            if isinstance(value, dict) and isinstance(old, dict):
+                key = "p50_ms" if "p50_ms" in value else "real_time_factor" if "real_time_factor" in value else None
+                if key and old.get(key):
+                    print(f"{group}.{name}.{key}: {old[key]} -> {value[key]} ({(value[key] / old[key] - 1) * 100:+.1f}%)")
+            elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"{group}.{name}: {old} -> {value} ({(value / old - 1) * 100:+.1f}%)")
+
+def main(args):
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "files": args.files,
+            "minutes": args.minutes,
+            "repeat": args.repeat,
+            "seed": args.seed
+        }
+    }
+
+    if not args.skip_endpoints:
+        folder = args.archive or tempfile.mkdtemp(prefix="audio_browser_bench_")
+        try:
+            print(f"Generating {args.files} recordings in {folder}...", file=sys.stderr)
+            paths = make_archive(folder, args.files, args.minutes, args.wav_seconds, args.seed)
+            print("Timing endpoints...", file=sys.stderr)
+            results["endpoints"] = bench_endpoints(folder, paths, args.repeat)
+        finally:
+            if args.archive is None:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    if args.transcribe:
+        print(f"Timing transcription with the {args.model} model...", file=sys.stderr)
+        results["transcription"] = bench_transcription(args.audio, args.model, args.audio_seconds)
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the audio browser endpoints and the transcription speed.")
+    parser.add_argument("--files", type=int, default=200, help="Recordings in the synthetic archive (default: 200).")
+    parser.add_argument("--minutes", type=float, default=60, help="Transcribed minutes per recording (default: 60).")
+    parser.add_argument("--wav-seconds", type=float, default=1, help="Length of the generated WAVs (default: 1).")
+    parser.add_argument("--repeat", type=int, default=20, help="Requests per endpoint (default: 20).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic archive (default: 0).")
+    parser.add_argument("--archive", help="Generate the archive here and keep it, instead of a temporary folder.")
+    parser.add_argument("--skip-endpoints", action="store_true", help="Only run the transcription benchmark.")
+    parser.add_argument("--transcribe", action="store_true", help="Also measure the real-time factor of transcription.")
+    parser.add_argument("--model", default="tiny", help="Whisper model for --transcribe (default: tiny).")
+    parser.add_argument("--audio", help="Audio file for --transcribe (default: generated noise).")
+    parser.add_argument("--audio-seconds", type=float, default=60, help="Length of the generated audio for --transcribe (default: 60).")
+    parser.add_argument("-o", "--output", help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    main(args)
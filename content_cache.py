@@ -0,0 +1,61 @@
+import os
+import json
+import hashlib
+
+from jsonfile import write_json
+from wavfile import WavError, read_header
+
+# Transcripts by audio content, shared by all transcription runs of this user
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "audio_browser", "transcripts")
+
+# Bytes hashed per read
+HASH_BLOCK = 4 << 20
+
+def audio_digest(audio_path):
+    """Hash of the audio content of a file, independent of its name and location.
+
+    For WAV files only the sample format and the data chunk are hashed, so
+    files that differ in metadata chunks still match; other formats are hashed
+    whole.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    try:
+        info = read_header(audio_path)
+        digest.update(f"{info.channels}:{info.sample_rate}:{info.bits_per_sample}:{info.format_tag}".encode())
+        start, remaining = info.data_offset, info.data_size
+    except WavError:
+        start, remaining = 0, os.path.getsize(audio_path)
+
+    with open(audio_path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+def cache_key(audio_path, settings):
+    """Key of a transcript: the audio content plus every setting that shapes the output."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(audio_digest(audio_path).encode())
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key + ".json")
+
+def lookup(cache_dir, key):
+    """The cached {"duration", "segments"} for key, or None."""
+    try:
+        with open(entry_path(cache_dir, key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def store(cache_dir, key, settings, duration, segments):
+    """Save a finished transcript under key."""
+    path = entry_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_json(path, {"settings": settings, "duration": duration, "segments": segments}, indent=None)
@@ -0,0 +1,158 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from jsonfile import atomic_write
+
+# The .txt sidecar is written for every transcription; subtitles on request
+DEFAULT_FORMATS = ("txt",)
+
+def format_timestamp(seconds, separator="."):
+    """'HH:MM:SS.mmm', rounded to the millisecond; SRT uses ',' as separator."""
+    milliseconds = max(0, round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02}:{minutes:02}:{seconds:02}{separator}{milliseconds:03}"
+
+def cues(segments):
+    """(start, end, text) of the segments with text, whitespace collapsed and end never before start."""
+    for segment in segments:
+        if not isinstance(segment, dict):
+            continue
+        text = " ".join(str(segment.get("text") or "").split())
+        start = segment.get("start")
+        end = segment.get("end")
+        if not text or not isinstance(start, (int, float)) or not isinstance(end, (int, float)):
+            continue
+        yield start, max(start, end), text
+
+def render_srt(segments):
+    blocks = [
+        f"{number}\n{format_timestamp(start, ',')} --> {format_timestamp(end, ',')}\n{text}\n"
+        for number, (start, end, text) in enumerate(cues(segments), start=1)
+    ]
+    return "\n".join(blocks)
+
+def render_vtt(segments):
+    blocks = ["WEBVTT\n"]
+    for start, end, text in cues(segments):
+        # Cue text is markup in WebVTT
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        blocks.append(f"{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n")
+    return "\n".join(blocks)
+
+def render_txt(segments):
+    return "".join(
+        f"[{format_timestamp(start)} - {format_timestamp(end)}] {text}\n"
+        for start, end, text in cues(segments)
+    )
+
+# Format -> (mimetype, renderer)
+FORMATS = {
+    "srt": ("application/x-subrip", render_srt),
+    "vtt": ("text/vtt", render_vtt),
+    "txt": ("text/plain", render_txt),
+}
+
+def render(segments, fmt):
+    return FORMATS[fmt][1](segments)
+
+def export_path(json_path, fmt):
+    return os.path.splitext(json_path)[0] + "." + fmt
+
+def write_text(path, text):
+    """Write text through a unique temporary file next to path and rename it into place."""
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def write_exports(json_path, segments, formats=DEFAULT_FORMATS):
+    """Write the segments of a transcript next to its .json in each format. Returns the paths written."""
+    written = []
+    for fmt in formats:
+        path = export_path(json_path, fmt)
+        write_text(path, render(segments, fmt))
+        written.append(path)
+    return written
+
+def is_up_to_date(json_path, output_path):
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(json_path)
+    except FileNotFoundError:
+        return False
+
+def transcript_segments(data, json_path):
+    """The segments of a parsed .json sidecar; raises ValueError if it is not a transcript."""
+    if not isinstance(data, dict) or not isinstance(data.get("transcript"), list):
+        raise ValueError(f"Not a transcript: {json_path}")
+    return data["transcript"]
+
+def export_file(json_path, formats=DEFAULT_FORMATS, force=False):
+    """Export one .json sidecar to the formats whose output is missing or older than it.
+
+    Returns the paths written; raises ValueError if the file is not a transcript.
+    """
+    stale = [fmt for fmt in formats if force or not is_up_to_date(json_path, export_path(json_path, fmt))]
+    if not stale:
+        return []
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return write_exports(json_path, transcript_segments(data, json_path), stale)
+
+def find_transcripts(root_dir):
+    """All .json files below root_dir, except hidden ones."""
+    transcripts = []
+    for dirpath, _, filenames in os.walk(root_dir):
+        for filename in filenames:
+            if filename.endswith(".json") and not filename.startswith("."):
+                transcripts.append(os.path.join(dirpath, filename))
+    return transcripts
+
+def export_one(json_path, formats, force):
+    # Worker body: (json_path, paths written or None if not a transcript, error)
+    try:
+        return json_path, export_file(json_path, formats, force), None
+    except ValueError:
+        return json_path, None, None
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        return json_path, [], str(e)
+
+def export_folder(root_dir, formats=DEFAULT_FORMATS, jobs=None, force=False):
+    """Export every transcript below root_dir, jobs files at a time. Returns (written, up to date, failed)."""
+    candidates = find_transcripts(root_dir)
+    print(f"Found {len(candidates)} .json files.")
+    written = current = failed = 0
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        futures = [executor.submit(export_one, json_path, formats, force) for json_path in candidates]
+        for future in as_completed(futures):
+            json_path, paths, error = future.result()
+            if error:
+                print(f"Error exporting {json_path}: {error}")
+                failed += 1
+            elif paths:
+                written += 1
+            elif paths is not None:
+                current += 1
+    return written, current, failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export transcripts as SRT or WebVTT subtitles or as text, from their .json sidecars.")
+    parser.add_argument("path", type=str, help="A transcript .json (or its .wav), or a folder to export recursively.")
+    parser.add_argument("-f", "--formats", nargs="+", choices=sorted(FORMATS), default=["srt"], help="Formats to write (default: srt).")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of files exported in parallel (default: number of CPU cores).")
+    parser.add_argument("--force", action="store_true", help="Rewrite outputs that are newer than their transcript.")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        written, current, failed = export_folder(args.path, args.formats, args.jobs, args.force)
+        print(f"Exported {written} transcripts, {current} already up to date, {failed} failed.")
+    else:
+        json_path = os.path.splitext(args.path)[0] + ".json"
+        if not os.path.exists(json_path):
+            print(f"Error: The file '{json_path}' does not exist.")
+        else:
+            try:
+                for path in export_file(json_path, args.formats, args.force) or ["Already up to date."]:
+                    print(path)
+            except ValueError as e:
+                print(f"Error: {e}")
@@ -0,0 +1,78 @@
+import os
+import json
+import stat
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialised
+    fcntl = None
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+@contextmanager
+def atomic_write(path, mode="w", encoding=None):
+    """Write to a unique temporary file next to path and atomically rename it into place.
+
+    Readers see either the old or the new file, never a half-written one, and
+    concurrent writers (threads or processes) never share a temporary file: the
+    last rename wins. Nothing is replaced if the block raises.
+    """
+    dirpath, filename = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{filename}.", suffix=".tmp", dir=dirpath)
+    try:
+        # mkstemp creates the file private; keep the permissions a plain open() would give
+        try:
+            mode_bits = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode_bits = 0o666 & ~umask
+        os.chmod(tmp_path, mode_bits)
+        with os.fdopen(fd, mode, encoding=encoding) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def write_json(path, data, indent=4):
+    """Write JSON to a temporary file next to path and atomically rename it into place."""
+    with atomic_write(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=indent)
+
+def content_etag(value):
+    """ETag derived from the content of a JSON value, independent of how the file was written."""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+    return f'"{hashlib.sha1(encoded).hexdigest()[:20]}"'
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive lock on path for a read-modify-write cycle.
+
+    Serialises threads of this process and, through flock() on a hidden
+    .<name>.lock file, other processes such as further server workers.
+    """
+    path = os.path.abspath(path)
+    with _thread_locks_lock:
+        thread_lock = _thread_locks.setdefault(path, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        dirpath, filename = os.path.split(path)
+        with open(os.path.join(dirpath, f".{filename}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+from contextlib import contextmanager
+from jsonfile import write_json
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def log_event(event, **fields):
+    """Print one structured log line."""
+    print(json.dumps({"event": event, "time": round(time.time(), 3), **fields}), flush=True)
+
+class StageTimer:
+    """Wall-clock time spent in the named stages of one job, logged as a single JSON line."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.perf_counter() - start
+
+    def log(self, event, **fields):
+        log_event(
+            event, **fields,
+            stages={name: round(seconds, 3) for name, seconds in self.stages.items()},
+            total=round(time.perf_counter() - self.started, 3)
+        )
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def render_metric(name, kind, help_text, samples):
+    """Prometheus text lines for a counter or gauge; samples maps label tuples to values."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in sorted(samples.items()):
+        lines.append(f"{name}{_labels(labels)} {value}")
+    return lines
+
+# Seconds between writes of a worker's metrics to the shared directory
+FLUSH_SECONDS = 5
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+class Metrics:
+    """Request counters, gauges and latency histograms, in the Prometheus text format.
+
+    Labels are passed as tuples of (name, value) pairs. Without a directory the
+    metrics are those of this process. With one, every process sharing it writes
+    its metrics there every FLUSH_SECONDS and render() adds them all up, so
+    several server workers report as one. Counters and histograms of workers
+    that exited are kept, so the totals never go down; their gauges are dropped.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, directory=None):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}    # name -> (help, {labels: value})
+        self.gauges = {}      # name -> (help, {labels: value})
+        # name -> (help, {labels: [count per bucket..., count above the top bucket, sum, count]})
+        self.histograms = {}
+        # Called with this object before rendering, to set values kept elsewhere
+        self.collectors = []
+        self.directory = directory
+        if directory:
+            self.path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+            threading.Thread(target=self.flush_forever, daemon=True).start()
+            atexit.register(self.flush)
+
+    def inc(self, name, help_text, labels=(), amount=1):
+        with self.lock:
+            samples = self.counters.setdefault(name, (help_text, {}))[1]
+            samples[labels] = samples.get(labels, 0) + amount
+
+    def set(self, name, help_text, labels, value, kind="gauge"):
+        """Set a gauge, or a counter that is counted elsewhere, to value."""
+        with self.lock:
+            samples = (self.gauges if kind == "gauge" else self.counters).setdefault(name, (help_text, {}))[1]
+            samples[labels] = value
+
+    def observe(self, name, help_text, labels, value):
+        with self.lock:
+            samples = self.histograms.setdefault(name, (help_text, {}))[1]
+            counts = samples.setdefault(labels, [0] * (len(self.buckets) + 3))
+            # Values above the top bucket land in the overflow slot, counted only by +Inf
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time_stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(
+                "audio_browser_stage_duration_seconds", "Time spent in stages of request handling.",
+                (("stage", stage),), time.perf_counter() - start
+            )
+
+    def snapshot(self):
+        """The metrics of this process as JSON-compatible data: {kind: {name: [help, [[labels, value], ...]]}}."""
+        for collect in self.collectors:
+            collect(self)
+        with self.lock:
+            return {
+                kind: {
+                    name: [help_text, [[labels, value] for labels, value in samples.items()]]
+                    for name, (help_text, samples) in store.items()
+                }
+                for kind, store in (("counter", self.counters), ("gauge", self.gauges), ("histogram", self.histograms))
+            }
+
+    def flush(self):
+        write_json(self.path, self.snapshot(), indent=None)
+
+    def flush_forever(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Error writing metrics: {e}")
+
+    def snapshots(self):
+        # (snapshot, process alive) of every process writing to the directory
+        if not self.directory:
+            return [(self.snapshot(), True)]
+        self.flush()
+        result = []
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith("metrics-") and filename.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                pid = int(filename[len("metrics-"):-len(".json")])
+            except (OSError, ValueError):
+                continue
+            result.append((snapshot, _pid_alive(pid)))
+        return result
+
+    def render(self):
+        merged = {"counter": {}, "gauge": {}, "histogram": {}}
+        for snapshot, alive in self.snapshots():
+            for kind, metrics in snapshot.items():
+                if kind == "gauge" and not alive:
+                    continue
+                for name, (help_text, samples) in metrics.items():
+                    target = merged[kind].setdefault(name, (help_text, {}))[1]
+                    for labels, value in samples:
+                        labels = tuple(tuple(pair) for pair in labels)
+                        if kind == "histogram":
+                            current = target.get(labels)
+                            target[labels] = value if current is None else [a + b for a, b in zip(current, value)]
+                        else:
+                            target[labels] = target.get(labels, 0) + value
+
+        lines = []
+        for kind in ("counter", "gauge"):
+            for name, (help_text, samples) in sorted(merged[kind].items()):
+                lines += render_metric(name, kind, help_text, samples)
+        for name, (help_text, samples) in sorted(merged["histogram"].items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for labels, counts in sorted(samples.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {counts[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {counts[-2]}")
+                lines.append(f"{name}_count{_labels(labels)} {counts[-1]}")
+        return lines
@@ -0,0 +1,26 @@
+import re
+
+def parse_filename(filename):
+    """Extract (date, place, notes) from a name following XXMMDD_Place_Notes_Recorderinfos.wav."""
+    date_match = re.match(r"^(\d{6,8})[-_]", filename)
+    date = date_match.group(1) if date_match else "unknown"
+    
+    try:
+        place = filename.split('_')[1]
+        place = place.replace(".wav", "")
+        place = place if place else "unknown"   
+
+        notes = filename.split('_', 2)[-1] if filename.count('_') >= 2 else ""
+        notes = notes.replace(".wav", "")
+        notes = re.sub(r'_Ste_\d{3}$', '', notes)  # Remove _Ste_IDX
+        notes = re.sub(r'Ste_\d{3}$', '', notes)
+        notes = re.sub(r'_\d{6}_\d{3}$', '', notes)  # Remove _YYMMDD_IDX
+        notes = re.sub(r'\d{6}_\d{3}$', '', notes)
+        notes = re.sub(r'_Neue_Aufnahme_\d+$', '', notes) # Remove _Neu_Aufnahme_IDX
+        notes = re.sub(r'Neue_Aufnahme_\d+$', '', notes)
+        notes = notes if notes else None  
+    except:
+        place = "unknown"
+        notes = None
+
+    return date, place, notes
@@ -0,0 +1,151 @@
+import os
+import struct
+import threading
+
+import numpy as np
+
+from wavfile import WavError, memmap_frames, to_float
+from jsonfile import atomic_write
+
+# Samples per peak of the finest level; every further level is ZOOM_FACTOR coarser
+BASE_SAMPLES_PER_PEAK = 256
+ZOOM_FACTOR = 4
+LEVELS = 6
+
+# Frames read from the memory map per step, a multiple of BASE_SAMPLES_PER_PEAK
+BLOCK_FRAMES = BASE_SAMPLES_PER_PEAK * 4096
+
+MAGIC = b"PEAK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIQ")  # magic, version, levels, sample rate, base samples per peak, frames
+LEVEL_HEADER = struct.Struct("<Q")  # number of peaks in the level
+
+_generate_lock = threading.Lock()
+
+def peaks_path(audio_path):
+    """Path of the .peaks sidecar belonging to an audio file."""
+    return os.path.splitext(audio_path)[0] + ".peaks"
+
+def compute_peaks(audio_path):
+    """Compute the min/max pyramid of a WAV file, streaming over its memory-mapped samples.
+
+    Returns (header info, list of int8 arrays of shape (peaks, 2), finest level first).
+    Channels are merged, so each peak spans the extremes of all channels.
+    """
+    frames, info = memmap_frames(audio_path)
+    count = -(-info.frames // BASE_SAMPLES_PER_PEAK)
+    finest = np.empty((count, 2), dtype=np.float32)
+
+    for start in range(0, info.frames, BLOCK_FRAMES):
+        block = to_float(frames[start:start + BLOCK_FRAMES], info).reshape(-1, info.channels)
+        usable = len(block) // BASE_SAMPLES_PER_PEAK * BASE_SAMPLES_PER_PEAK
+        first = start // BASE_SAMPLES_PER_PEAK
+        if usable:
+            buckets = block[:usable].reshape(-1, BASE_SAMPLES_PER_PEAK * info.channels)
+            finest[first:first + len(buckets), 0] = buckets.min(axis=1)
+            finest[first:first + len(buckets), 1] = buckets.max(axis=1)
+        if usable < len(block):
+            # Last, partial bucket of the file
+            finest[-1] = block[usable:].min(), block[usable:].max()
+
+    levels = [np.clip(np.round(finest * 127), -127, 127).astype(np.int8)]
+    for _ in range(1, LEVELS):
+        previous = levels[-1]
+        if len(previous) <= 1:
+            break
+        padded = -(-len(previous) // ZOOM_FACTOR) * ZOOM_FACTOR
+        grouped = np.empty((padded, 2), dtype=np.int8)
+        grouped[:len(previous)] = previous
+        grouped[len(previous):] = previous[-1]
+        grouped = grouped.reshape(-1, ZOOM_FACTOR, 2)
+        levels.append(np.stack([grouped[:, :, 0].min(axis=1), grouped[:, :, 1].max(axis=1)], axis=1))
+    return info, levels
+
+def write_peaks(audio_path):
+    """Compute the peaks of audio_path and write them to its .peaks sidecar."""
+    info, levels = compute_peaks(audio_path)
+    path = peaks_path(audio_path)
+    # A unique temporary file: the server workers and the background jobs may write the same sidecar
+    with atomic_write(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(levels), info.sample_rate, BASE_SAMPLES_PER_PEAK, info.frames))
+        for level in levels:
+            f.write(LEVEL_HEADER.pack(len(level)))
+        for level in levels:
+            f.write(level.tobytes())
+    return path
+
+def is_up_to_date(audio_path):
+    try:
+        return os.path.getmtime(peaks_path(audio_path)) >= os.path.getmtime(audio_path)
+    except OSError:
+        return False
+
+def ensure_peaks(audio_path):
+    """Write the .peaks sidecar of audio_path unless an up-to-date one exists."""
+    with _generate_lock:
+        if not is_up_to_date(audio_path):
+            write_peaks(audio_path)
+    return peaks_path(audio_path)
+
+def generate_missing(audio_paths):
+    """Background stage: make sure every file in audio_paths has current peaks."""
+    for audio_path in audio_paths:
+        if is_up_to_date(audio_path):
+            continue
+        try:
+            ensure_peaks(audio_path)
+        except (WavError, OSError, ValueError) as e:
+            print(f"Skipping peaks for {audio_path}: {e}")
+
+def read_peaks(path, zoom=None, width=None, start=0.0, end=None):
+    """Read one resolution window from a .peaks sidecar, without loading the other levels.
+
+    zoom picks the level (0 is finest); alternatively width picks the coarsest
+    level that still has at least width peaks over the window. start and end
+    are in seconds.
+    """
+    with open(path, "rb") as f:
+        magic, version, level_count, sample_rate, base, frames = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a peaks file: {path}")
+        counts = [LEVEL_HEADER.unpack(f.read(LEVEL_HEADER.size))[0] for _ in range(level_count)]
+        data_offset = f.tell()
+
+        duration = frames / sample_rate
+        end = duration if end is None else min(end, duration)
+        start = max(0.0, min(start, end))
+
+        if zoom is None:
+            zoom = 0
+            if width:
+                while zoom + 1 < level_count:
+                    samples = base * ZOOM_FACTOR ** (zoom + 1)
+                    if (end - start) * sample_rate / samples < width:
+                        break
+                    zoom += 1
+        zoom = max(0, min(zoom, level_count - 1))
+
+        samples_per_peak = base * ZOOM_FACTOR ** zoom
+        first = min(counts[zoom], int(start * sample_rate // samples_per_peak))
+        last = min(counts[zoom], -(-int(end * sample_rate) // samples_per_peak))
+
+        f.seek(data_offset + 2 * (sum(counts[:zoom]) + first))
+        data = np.frombuffer(f.read(2 * (last - first)), dtype=np.int8)
+
+    return {
+        "sample_rate": sample_rate,
+        "duration": duration,
+        "zoom": zoom,
+        "levels": level_count,
+        "samples_per_peak": samples_per_peak,
+        "start": first * samples_per_peak / sample_rate,
+        "peaks": data.tolist()
+    }
+
+def try_write_peaks(audio_path):
+    """Pipeline hook: write peaks for WAV input, skipping formats the reader cannot map."""
+    try:
+        ensure_peaks(audio_path)
+        print(f"Waveform peaks saved to {os.path.basename(peaks_path(audio_path))}")
+    except (WavError, OSError, ValueError) as e:
+        print(f"Skipping waveform peaks: {e}")
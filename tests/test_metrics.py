@@ -0,0 +1,46 @@
+import os
+import sys
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics
+
+def histogram_lines(metrics):
+    return {line.split()[0]: float(line.split()[1]) for line in metrics.render() if not line.startswith("#")}
+
+def test_value_above_top_bucket_counts_only_in_inf():
+    metrics = Metrics(buckets=(1, 30))
+    metrics.observe("latency_seconds", "Latency.", (), 0.5)
+    metrics.observe("latency_seconds", "Latency.", (), 45)
+
+    lines = histogram_lines(metrics)
+    assert lines['latency_seconds_bucket{le="1"}'] == 1
+    assert lines['latency_seconds_bucket{le="30"}'] == 1
+    assert lines['latency_seconds_bucket{le="+Inf"}'] == 2
+    assert lines["latency_seconds_sum"] == 45.5
+    assert lines["latency_seconds_count"] == 2
+
+def record_in_worker(directory):
+    metrics = Metrics(directory=directory)
+    metrics.inc("requests_total", "Requests.", (("route", "/"),), 3)
+    metrics.set("cache_entries", "Entries.", (), 7)
+    metrics.observe("latency_seconds", "Latency.", (), 2)
+    metrics.flush()
+
+def test_processes_sharing_a_directory_are_added_up(tmp_path):
+    worker = multiprocessing.get_context("spawn").Process(target=record_in_worker, args=(str(tmp_path),))
+    worker.start()
+    worker.join()
+
+    metrics = Metrics(directory=str(tmp_path))
+    metrics.inc("requests_total", "Requests.", (("route", "/"),), 2)
+    metrics.set("cache_entries", "Entries.", (), 1)
+    metrics.observe("latency_seconds", "Latency.", (), 0.01)
+
+    lines = histogram_lines(metrics)
+    assert lines['requests_total{route="/"}'] == 5
+    assert lines["latency_seconds_count"] == 2
+    assert lines["latency_seconds_sum"] == 2.01
+    # The gauge of the exited worker is dropped
+    assert lines["cache_entries"] == 1
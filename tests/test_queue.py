@@ -0,0 +1,58 @@
+import os
+import sys
+from contextlib import closing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive_index
+import transcription_queue
+
+def test_requested_then_shorter_files_go_first(tmp_path):
+    with closing(archive_index.connect(str(tmp_path))) as conn:
+        transcription_queue.enqueue(conn, "long.wav", 3600)
+        transcription_queue.enqueue(conn, "short.wav", 60)
+        transcription_queue.enqueue(conn, "asked.wav", 7200, requested=True)
+
+        claimed = [transcription_queue.claim_next(conn, 2.0, worker="test 1")["path"] for _ in range(3)]
+        assert claimed == ["asked.wav", "short.wav", "long.wav"]
+        assert transcription_queue.claim_next(conn, 2.0) is None
+
+def test_queuing_again_raises_priority_but_leaves_running_jobs(tmp_path):
+    with closing(archive_index.connect(str(tmp_path))) as conn:
+        transcription_queue.enqueue(conn, "a.wav", 60)
+        transcription_queue.enqueue(conn, "b.wav", 120)
+        transcription_queue.enqueue(conn, "b.wav", 120, requested=True)
+        assert transcription_queue.claim_next(conn, 1.0, worker="test 1")["path"] == "b.wav"
+
+        # Requesting a running job does not start it over
+        transcription_queue.enqueue(conn, "b.wav", 120, requested=True)
+        states = {job["file"]: job["state"] for job in transcription_queue.jobs(conn)}
+        assert states == {"a.wav": "queued", "b.wav": "running"}
+
+def test_finished_and_failed_jobs_are_listed_and_can_be_queued_anew(tmp_path):
+    with closing(archive_index.connect(str(tmp_path))) as conn:
+        transcription_queue.enqueue(conn, "a.wav", 60)
+        transcription_queue.enqueue(conn, "b.wav", 60)
+        transcription_queue.claim_next(conn, 1.0, worker="test 1")
+        transcription_queue.finish(conn, "a.wav")
+        transcription_queue.claim_next(conn, 1.0, worker="test 1")
+        transcription_queue.finish(conn, "b.wav", "Transcription failed")
+
+        jobs = {job["file"]: job for job in transcription_queue.jobs(conn)}
+        assert jobs["a.wav"]["state"] == "done"
+        assert jobs["b.wav"]["state"] == "failed"
+        assert jobs["b.wav"]["error"] == "Transcription failed"
+
+        transcription_queue.enqueue(conn, "b.wav", 60)
+        assert transcription_queue.claim_next(conn, 1.0)["path"] == "b.wav"
+
+def test_queued_jobs_get_an_eta_in_queue_order(tmp_path):
+    with closing(archive_index.connect(str(tmp_path))) as conn:
+        transcription_queue.enqueue(conn, "a.wav", 60)
+        transcription_queue.enqueue(conn, "b.wav", 120)
+        transcription_queue.claim_next(conn, 2.0, worker="test 1")
+
+        jobs = {job["file"]: job for job in transcription_queue.jobs(conn)}
+        assert jobs["b.wav"]["position"] == 1
+        # a.wav has at most 30 s left at 2x real time, b.wav takes 60 s more
+        assert 60 <= jobs["b.wav"]["eta_seconds"] <= 90
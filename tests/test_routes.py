@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+from contextlib import closing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotation_journal
+import archive_index
+from audio_browser import create_app
+from jsonfile import content_etag
+
+SEGMENTS = [
+    {"start": 0.0, "end": 2.5, "text": " Hello there."},
+    {"start": 2.5, "end": 4.0, "text": " General Kenobi."},
+]
+
+def archive(tmp_path):
+    # An audio folder holding one transcript, and a transcript outside of it
+    audio_folder = tmp_path / "audio"
+    audio_folder.mkdir()
+    (audio_folder / "talk.json").write_text(json.dumps({"notes": "", "transcript": SEGMENTS}))
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "x.json").write_text(json.dumps({"transcript": SEGMENTS}))
+    return str(audio_folder), outside / "x.json"
+
+def client(audio_folder):
+    return create_app(audio_folder, background=False).test_client()
+
+def read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def test_patch_updates_segment_and_returns_new_etag(tmp_path):
+    audio_folder, _ = archive(tmp_path)
+    browser = client(audio_folder)
+    etag = browser.get("/transcription/talk.wav").headers["ETag"]
+    assert etag == content_etag(SEGMENTS)
+
+    response = browser.patch(
+        "/transcription/talk.wav", json={"segments": [{"index": 1, "text": " Hi."}]}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert read_json(os.path.join(audio_folder, "talk.json"))["transcript"][1]["text"] == " Hi."
+    # The next edit goes through with the ETag of the previous one
+    response = browser.patch(
+        "/transcription/talk.wav", json={"segments": [{"index": 0, "text": " Hey."}]},
+        headers={"If-Match": response.headers["ETag"]}
+    )
+    assert response.status_code == 200
+
+def test_patch_with_stale_etag_is_rejected(tmp_path):
+    audio_folder, _ = archive(tmp_path)
+    browser = client(audio_folder)
+    stale = content_etag(SEGMENTS)
+    browser.patch("/transcription/talk.wav", json={"segments": [{"index": 0, "text": " A."}]}, headers={"If-Match": stale})
+
+    response = browser.patch(
+        "/transcription/talk.wav", json={"segments": [{"index": 0, "text": " B."}]}, headers={"If-Match": stale}
+    )
+    assert response.status_code == 412
+    assert read_json(os.path.join(audio_folder, "talk.json"))["transcript"][0]["text"] == " A."
+
+def test_patch_needs_if_match_and_valid_segments(tmp_path):
+    audio_folder, _ = archive(tmp_path)
+    browser = client(audio_folder)
+    etag = content_etag(SEGMENTS)
+    assert browser.patch("/transcription/talk.wav", json={"segments": []}).status_code == 428
+    for change in ({"index": "0"}, {"index": 0, "start": "soon"}, {"index": 0, "text": 5}, {"index": 9, "text": "x"}):
+        response = browser.patch("/transcription/talk.wav", json={"segments": [change]}, headers={"If-Match": etag})
+        assert response.status_code == 400, change
+    assert read_json(os.path.join(audio_folder, "talk.json"))["transcript"] == SEGMENTS
+
+def test_write_routes_reject_paths_outside_the_audio_folder(tmp_path):
+    audio_folder, outside = archive(tmp_path)
+    browser = client(audio_folder)
+    etag = content_etag(SEGMENTS)
+
+    responses = [
+        browser.patch("/transcription/../outside/x.json", json={"segments": [{"index": 0, "text": "x"}]}, headers={"If-Match": etag}),
+        browser.post("/update_transcription/../outside/x.json", json={"transcription": []}),
+        browser.post("/add_annotation/../outside/x.json", json={"annotation": {"start": 0, "end": 1, "text": "x"}}),
+        browser.post("/update_notes/../outside/x.json", json={"notes": "x"}),
+        browser.get("/transcription/../outside/x.json"),
+    ]
+    assert [response.status_code for response in responses] == [404] * len(responses)
+    assert read_json(outside) == {"transcript": SEGMENTS}
+    # No lock file was left next to it either
+    assert os.listdir(outside.parent) == ["x.json"]
+    with closing(archive_index.connect(audio_folder)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0] == 0
+
+def test_annotations_and_notes_are_merged_then_compacted(tmp_path):
+    audio_folder, _ = archive(tmp_path)
+    browser = client(audio_folder)
+    annotation = {"start": 0, "end": 2.5, "text": "greeting"}
+    assert browser.post("/add_annotation/talk.wav", json={"annotation": annotation}).status_code == 200
+    assert browser.post("/update_notes/talk.wav", json={"notes": "first take"}).status_code == 200
+
+    served = browser.get("/transcription/talk.wav").get_json()
+    assert served["notes"] == "first take"
+    assert [a["text"] for a in served["annotations"]] == ["greeting"]
+    # Journaled, not yet written to the sidecar
+    assert "annotations" not in read_json(os.path.join(audio_folder, "talk.json"))
+
+    annotation_journal.compact(audio_folder, min_age=0)
+    stored = read_json(os.path.join(audio_folder, "talk.json"))
+    assert stored["notes"] == "first take"
+    assert [a["text"] for a in stored["annotations"]] == ["greeting"]
+    assert browser.get("/transcription/talk.wav").get_json()["annotations"] == stored["annotations"]
+
+def test_export_of_a_sidecar_without_segments_is_rejected(tmp_path):
+    audio_folder, _ = archive(tmp_path)
+    with open(os.path.join(audio_folder, "empty.json"), "w") as f:
+        json.dump({"transcript": None}, f)
+    browser = client(audio_folder)
+
+    response = browser.get("/export/talk.srt")
+    assert response.status_code == 200
+    assert "00:00:00,000 --> 00:00:02,500\nHello there." in response.get_data(as_text=True)
+    assert browser.get("/export/empty.srt").status_code == 422
+    assert browser.get("/export/../outside/x.srt").status_code == 404
@@ -0,0 +1,63 @@
+import os
+import json
+import socket
+from datetime import datetime
+
+from jsonfile import locked, write_json
+
+# Measured speeds, shared by all transcription runs of this user on this machine
+STATS_PATH = os.path.join(os.path.expanduser("~"), ".cache", "audio_browser", "throughput.json")
+
+# Audio seconds per wall-clock second assumed until a configuration has been measured
+# (the old hard-coded estimate, from the medium model on one laptop)
+DEFAULT_SPEED = 5.642
+
+# Runs kept per configuration for the rolling estimate
+ROLLING_RUNS = 20
+
+def stats_key(model_name, beam_size, workers=1, threads=None, parallel_files=1, host=None):
+    """Configuration a speed was measured for.
+
+    workers processes with threads torch threads each share one file, and
+    parallel_files files are transcribed at the same time on the machine.
+    """
+    key = f"{model_name} beam={beam_size} workers={workers}"
+    if threads:
+        key += f" threads={threads}"
+    if parallel_files > 1:
+        key += f" files={parallel_files}"
+    return f"{key} @{host or socket.gethostname()}"
+
+def load_stats(path=STATS_PATH):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def estimate(key, path=STATS_PATH):
+    """Rolling audio seconds transcribed per wall-clock second for key, over the recent runs."""
+    runs = load_stats(path).get(key, [])
+    audio = sum(run["audio"] for run in runs)
+    wall = sum(run["wall"] for run in runs)
+    if audio <= 0 or wall <= 0:
+        return DEFAULT_SPEED
+    return audio / wall
+
+def record(key, audio_seconds, wall_seconds, path=STATS_PATH):
+    """Add one measured run for key, keeping the last ROLLING_RUNS."""
+    if audio_seconds <= 0 or wall_seconds <= 0:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Parallel workers record into the same file
+    with locked(path):
+        stats = load_stats(path)
+        runs = stats.setdefault(key, [])
+        runs.append({"audio": round(audio_seconds, 2), "wall": round(wall_seconds, 2)})
+        del runs[:-ROLLING_RUNS]
+        write_json(path, stats)
+
+def format_eta(seconds_left):
+    """'12.3 minutes (done at 2025-03-01 14:05:12)'."""
+    end = datetime.fromtimestamp(datetime.now().timestamp() + seconds_left)
+    return f"{seconds_left / 60:.1f} minutes (done at {end.strftime('%Y-%m-%d %H:%M:%S')})"
@@ -0,0 +1,91 @@
+import os
+import hashlib
+import subprocess
+import tempfile
+import threading
+
+# Cache directory inside the audio folder; hidden, so archive scans skip it
+CACHE_DIRNAME = ".transcode_cache"
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# format name -> (file extension, mimetype, ffmpeg encoder arguments)
+FORMATS = {
+    "opus": (".ogg", "audio/ogg", ["-c:a", "libopus", "-b:a", "64k", "-vbr", "on"]),
+    "aac": (".m4a", "audio/mp4", ["-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart"]),
+}
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _lock_for(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+def cache_key(source_path, fmt):
+    """Name of the cached transcode; changes whenever the source file does."""
+    stat = os.stat(source_path)
+    digest = hashlib.sha1(
+        f"{os.path.abspath(source_path)}\0{stat.st_mtime_ns}\0{stat.st_size}\0{fmt}".encode()
+    ).hexdigest()
+    return digest + FORMATS[fmt][0]
+
+def transcode(source_path, output_path, fmt):
+    """Encode source_path to fmt with ffmpeg, writing output_path atomically."""
+    dirpath = os.path.dirname(output_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=FORMATS[fmt][0], dir=dirpath)
+    os.close(fd)
+    try:
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", source_path, "-vn", *FORMATS[fmt][2], tmp_path],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def evict(cache_dir, max_bytes, keep=None):
+    """Delete least recently used transcodes until the cache fits in max_bytes."""
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if entry.name.startswith('.') or not entry.is_file():
+            continue  # transcodes still in progress
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+def cached_transcode(audio_folder, source_path, fmt, max_bytes=DEFAULT_MAX_BYTES):
+    """Return the path of a cached fmt transcode of source_path, creating it if needed.
+
+    Cache hits refresh the file's mtime, which evict() uses as the last access time.
+    """
+    cache_dir = os.path.join(audio_folder, CACHE_DIRNAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    key = cache_key(source_path, fmt)
+    output_path = os.path.join(cache_dir, key)
+
+    # Concurrent requests for the same file wait for one transcode
+    with _lock_for(key):
+        if os.path.exists(output_path):
+            os.utime(output_path)
+            return output_path
+        transcode(source_path, output_path, fmt)
+
+    evict(cache_dir, max_bytes, keep=output_path)
+    return output_path
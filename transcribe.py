@@ -1,122 +1,33 @@
-import ffmpeg
-import time
-import itertools
-import whisper
-import json
 import os
-import re
-from datetime import datetime
 from pathlib import Path
 import argparse
 import sys
+from transcriber import Transcriber, DEFAULT_MODEL, make_transcriber, transcribe_file
+import export
+import content_cache
+from naming import parse_filename
 
-def transcribe_audio(audio_path):
+def transcribe_audio(audio_path, transcriber=None, cache_dir=content_cache.DEFAULT_CACHE_DIR, export_formats=export.DEFAULT_FORMATS):
     if not os.path.exists(audio_path):
         raise FileNotFoundError(f"File not found: {audio_path}")
 
     print(f"Processing audio file: {audio_path}")
 
-    start_time = time.time()
-
     filename = os.path.basename(audio_path)
     filename_without_extension = os.path.splitext(filename)[0]
-    date_match = re.match(r"^(\d{6,8})[-_]", filename)
-    date = date_match.group(1) if date_match else "unknown"
-    
-    try:
-        place = filename.split('_')[1]
-        place = place.replace(".wav", "")
-        place = place if place else "unknown"   
+    date, place, notes = parse_filename(filename)
+    parent_dir = str(Path(audio_path).parent)
+    json_file_path = parent_dir + f"/{filename_without_extension}.json"
 
-        notes = filename.split('_', 2)[-1] if filename.count('_') >= 2 else ""
-        notes = notes.replace(".wav", "")
-        notes = re.sub(r'_Ste_\d{3}$', '', notes)  # Remove _Ste_IDX
-        notes = re.sub(r'Ste_\d{3}$', '', notes)
-        notes = re.sub(r'_\d{6}_\d{3}$', '', notes)  # Remove _YYMMDD_IDX
-        notes = re.sub(r'\d{6}_\d{3}$', '', notes)
-        notes = re.sub(r'_Neue_Aufnahme_\d+$', '', notes) # Remove _Neu_Aufnahme_IDX
-        notes = re.sub(r'Neue_Aufnahme_\d+$', '', notes)
-        notes = notes if notes else None  
-    except:
-        place = "unknown"
-        notes = None
-    
     print("Date:", date)
     print("Place:", place)
     print("Notes:", notes)
 
-    # Get audio duration using ffmpeg
-    probe = ffmpeg.probe(audio_path, v='error', select_streams='a', show_entries='stream=duration')
-    audio_duration_seconds = float(probe['streams'][0]['duration'])
-    audio_duration_minutes = audio_duration_seconds / 60
-
-    processing_speed = 5.642  # Minutes of audio processed per minute of processing
-    estimated_processing_time = audio_duration_minutes / processing_speed 
-
-    print(f"Audio duration: {audio_duration_minutes:.2f} minutes")
-    print(f"Estimated processing time: {estimated_processing_time:.2f} minutes")
-
-    expected_end_time = start_time + (estimated_processing_time * 60)
-    end_time_human_readable = datetime.fromtimestamp(expected_end_time).strftime('%Y-%m-%d %H:%M:%S')
-
-    print(f"Running whisper. Expected completion time: {end_time_human_readable}")
-
-    model = whisper.load_model("medium")
-
-    print(f"Transcribing... This may take a while.")
-
-    result = model.transcribe(
-        audio_path, 
-        word_timestamps=False,  # True enables word-level timestamps
-        temperature=0.2,  # set to 0 for deterministic results (5-10% faster)
-        beam_size=5,       # set to 1 to disable beam search (30-50% faster)
-        fp16=False          # set to True to use mixed-precision (GPU only)
-    )
-
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-
-    def remove_consecutive_duplicates(transcription):
-        return [key for key, _ in itertools.groupby(transcription)]
-
-    cleaned_transcription = remove_consecutive_duplicates(result['segments'])
-
-    json_data = {
-        "path": audio_path,
-        "duration": audio_duration_minutes,
-        "date": date,
-        "place": place,
-        "notes": notes,
-        "transcript": []
-    }
-    parent_dir = str(Path(audio_path).parent)
-
-    # Write the cleaned transcription to a text file and add it to the JSON data
-    with open(parent_dir + f"/{filename_without_extension}.txt", "w", encoding="utf-8") as txt_file:
-        for segment in cleaned_transcription:
-            start_time = segment["start"]
-            end_time = segment["end"]
-            text = segment["text"]
-
-            # Convert to HH:MM:SS format for the text file
-            start_hms = f"{int(start_time // 3600):02}:{int((start_time % 3600) // 60):02}:{int(start_time % 60):02}"
-            end_hms = f"{int(end_time // 3600):02}:{int((end_time % 3600) // 60):02}:{int(end_time % 60):02}"
+    if transcriber is None:
+        transcriber = Transcriber()
 
-            txt_file.write(f"[{start_hms} - {end_hms}] {text}\n")
-            
-            json_data["transcript"].append({
-                "start": start_time,
-                "end": end_time,
-                "text": text
-            })
-
-    json_file_path = parent_dir + f"/{filename_without_extension}.json"
-    with open(json_file_path, "w", encoding="utf-8") as json_file:
-        json.dump(json_data, json_file, indent=4)
-
-    print(f"Transcription completed in {elapsed_time:.2f} seconds (~{elapsed_time/60:.2f} minutes).")
-    print(f"Transcription text saved to {filename_without_extension}.txt")
-    print(f"Transcription JSON saved to {filename_without_extension}.json'")
+    metadata = {"path": audio_path, "date": date, "place": place, "notes": notes}
+    return transcribe_file(audio_path, json_file_path, metadata, transcriber, cache_dir, export_formats)
 
 def check_audio_path(audio_path):
     if not os.path.exists(audio_path):
@@ -132,11 +43,36 @@ def check_audio_path(audio_path):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Transcribe audio file and extract metadata from the filename.",
-        usage="%(prog)s [audio_path]",
+        usage="%(prog)s [audio_path] [-m model] [-c chunk_minutes] [-w workers] [-t threads] [-e formats]",
     )
     parser.add_argument(
         'audio_path', type=str, nargs='?', help="Path to the audio file. Example: '/path/to/file.wav'"
     )
+    parser.add_argument(
+        '-m', '--model', type=str, default=DEFAULT_MODEL, help=f"Whisper model to use (default: {DEFAULT_MODEL})."
+    )
+    parser.add_argument(
+        '-c', '--chunk-minutes', type=float, help="Transcribe long recordings in chunks of about this length, cut at silences."
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=1, help="Transcribe the chunks in this many parallel worker processes (default: 1)."
+    )
+    parser.add_argument(
+        '-t', '--threads', type=int, help="Torch threads per worker (default: CPU cores divided by workers)."
+    )
+    parser.add_argument(
+        '--cache-dir', type=str, default=content_cache.DEFAULT_CACHE_DIR,
+        help=f"Cache of transcripts by audio content, reused for identical recordings (default: {content_cache.DEFAULT_CACHE_DIR})."
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true', help="Neither use nor fill the transcript cache."
+    )
+    parser.add_argument(
+        '--word-timestamps', action='store_true', help="Also record when each word starts and ends, in a .words file next to the .json."
+    )
+    parser.add_argument(
+        '-e', '--export', nargs='+', choices=['srt', 'vtt'], default=[], help="Also write subtitles in these formats next to the .txt."
+    )
 
     args = parser.parse_args()
 
@@ -145,4 +81,5 @@ if __name__ == "__main__":
         sys.exit(1)
     
     if check_audio_path(args.audio_path):
-        transcribe_audio(args.audio_path)
\ No newline at end of file
+        with make_transcriber(args.model, args.workers, args.threads, args.chunk_minutes, args.word_timestamps) as transcriber:
+            transcribe_audio(args.audio_path, transcriber, None if args.no_cache else args.cache_dir, (*export.DEFAULT_FORMATS, *args.export))
\ No newline at end of file
@@ -1,30 +1,14 @@
-import ffmpeg
-import time
-import itertools
-import whisper
-import json
 import os
-from datetime import datetime
 from pathlib import Path
 import argparse
 import sys
+from transcriber import Transcriber, DEFAULT_MODEL, make_transcriber, transcribe_file
+import export
+import content_cache
 
 AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".aac", ".ogg", ".m4a", ".aiff")
 
-def convert_to_wav(input_file, output_file):
-    try:
-        (
-            ffmpeg
-            .input(input_file)
-            .output(output_file, acodec='pcm_s16le', ar=16000) #whisper resamples anyway to 16k
-            .overwrite_output()
-            .run(quiet=True)
-        )
-        print(f"Converted: {input_file} -> {output_file}")
-    except ffmpeg.Error as e:
-        print(f"Error converting {input_file}: {e}")
-
-def transcribe_audio(audio_path, destination_folder=None):
+def transcribe_audio(audio_path, destination_folder=None, transcriber=None, cache_dir=content_cache.DEFAULT_CACHE_DIR, export_formats=export.DEFAULT_FORMATS):
     if not os.path.exists(audio_path):
         raise FileNotFoundError(f"File not found: {audio_path}")
 
@@ -34,98 +18,27 @@ def transcribe_audio(audio_path, destination_folder=None):
             f"Not an audio file: {', '.join(AUDIO_EXTENSIONS)}"
         )
 
-    if ext.lower() != ".wav":
-        print(f"Converting {ext} to .wav")
-        filename_without_ext = os.path.splitext(audio_path)[0]
-        wav_path = f"{filename_without_ext}.wav"
-        convert_to_wav(audio_path, wav_path)
-        audio_path = wav_path 
-        print(f"Conversion complete: {wav_path}")
-
     print(f"Processing audio file: {audio_path}")
 
-    start_time = time.time()
-
     filename = os.path.basename(audio_path)
     filename_without_extension = os.path.splitext(filename)[0]
 
-    probe = ffmpeg.probe(audio_path, v='error', select_streams='a', show_entries='stream=duration')
-    audio_duration_seconds = float(probe['streams'][0]['duration'])
-    audio_duration_minutes = audio_duration_seconds / 60
-
-    processing_speed = 5.642  # rough estimation on my laptop
-    estimated_processing_time = audio_duration_minutes / processing_speed 
-
-    print(f"Audio duration: {audio_duration_minutes:.2f} minutes")
-    print(f"Estimated processing time: {estimated_processing_time:.2f} minutes")
-
-    expected_end_time = start_time + (estimated_processing_time * 60)
-    end_time_human_readable = datetime.fromtimestamp(expected_end_time).strftime('%Y-%m-%d %H:%M:%S')
-
-    print(f"Running whisper. Expected completion time: {end_time_human_readable}")
-
-    model = whisper.load_model("medium")
-
-    print(f"Transcribing... This may take a while.")
-
-    result = model.transcribe(
-        audio_path, 
-        word_timestamps=False,  # True enables word-level timestamps
-        temperature=0.2,  # set to 0 for deterministic results (5-10% faster)
-        beam_size=5,       # set to 1 to disable beam search (30-50% faster)
-        fp16=False          # set to True to use mixed-precision (GPU only)
-    )
-
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-
-    def remove_consecutive_duplicates(transcription):
-        return [key for key, _ in itertools.groupby(transcription)]
-
-    cleaned_transcription = remove_consecutive_duplicates(result['segments'])
-
-    json_data = {
-        "file": audio_path,
-        "duration": audio_duration_minutes,
-        "transcript": []
-    }
-
     if destination_folder:
         output_dir = destination_folder
         os.makedirs(output_dir, exist_ok=True)
     else:
         output_dir = str(Path(audio_path).parent)
-
-    with open(os.path.join(output_dir, f"{filename_without_extension}.txt"), "w", encoding="utf-8") as txt_file:
-        for segment in cleaned_transcription:
-            start_time = segment["start"]
-            end_time = segment["end"]
-            text = segment["text"]
-
-            # Convert to HH:MM:SS format for the text file
-            start_hms = f"{int(start_time // 3600):02}:{int((start_time % 3600) // 60):02}:{int(start_time % 60):02}"
-            end_hms = f"{int(end_time // 3600):02}:{int((end_time % 3600) // 60):02}:{int(end_time % 60):02}"
-
-            txt_file.write(f"[{start_hms} - {end_hms}] {text}\n")
-            
-            json_data["transcript"].append({
-                "start": start_time,
-                "end": end_time,
-                "text": text
-            })
-
     json_file_path = os.path.join(output_dir, f"{filename_without_extension}.json")
-    with open(json_file_path, "w", encoding="utf-8") as json_file:
-        json.dump(json_data, json_file, indent=4)
 
-    print(f"Transcription completed in {elapsed_time:.2f} seconds (~{elapsed_time/60:.2f} minutes).")
-    print(f"Transcription text saved to {os.path.join(output_dir, filename_without_extension + '.txt')}")
-    print(f"Transcription JSON saved to {os.path.join(output_dir, filename_without_extension + '.json')}")
+    if transcriber is None:
+        transcriber = Transcriber()
+
+    return transcribe_file(audio_path, json_file_path, {"file": audio_path}, transcriber, cache_dir, export_formats)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Transcribe audio file.",
-        usage="%(prog)s [audio_path] [-d destination_folder]",
+        usage="%(prog)s [audio_path] [-d destination_folder] [-m model] [-c chunk_minutes] [-w workers] [-t threads] [-e formats]",
     )
     parser.add_argument(
         'audio_path', type=str, nargs='?', help="Path to the audio file. Example: '/path/to/file.wav'"
@@ -133,6 +46,31 @@ if __name__ == "__main__":
     parser.add_argument(
         '-d', '--destination', type=str, help="Destination folder for output files. If not specified, uses the same directory as the audio file."
     )
+    parser.add_argument(
+        '-m', '--model', type=str, default=DEFAULT_MODEL, help=f"Whisper model to use (default: {DEFAULT_MODEL})."
+    )
+    parser.add_argument(
+        '-c', '--chunk-minutes', type=float, help="Transcribe long recordings in chunks of about this length, cut at silences."
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=1, help="Transcribe the chunks in this many parallel worker processes (default: 1)."
+    )
+    parser.add_argument(
+        '-t', '--threads', type=int, help="Torch threads per worker (default: CPU cores divided by workers)."
+    )
+    parser.add_argument(
+        '--cache-dir', type=str, default=content_cache.DEFAULT_CACHE_DIR,
+        help=f"Cache of transcripts by audio content, reused for identical recordings (default: {content_cache.DEFAULT_CACHE_DIR})."
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true', help="Neither use nor fill the transcript cache."
+    )
+    parser.add_argument(
+        '--word-timestamps', action='store_true', help="Also record when each word starts and ends, in a .words file next to the .json."
+    )
+    parser.add_argument(
+        '-e', '--export', nargs='+', choices=['srt', 'vtt'], default=[], help="Also write subtitles in these formats next to the .txt."
+    )
 
     args = parser.parse_args()
 
@@ -140,4 +78,8 @@ if __name__ == "__main__":
         print("No audio path provided. Please provide the path to an audio file.")
         sys.exit(1)
     
-    transcribe_audio(args.audio_path, args.destination)
\ No newline at end of file
+    with make_transcriber(args.model, args.workers, args.threads, args.chunk_minutes, args.word_timestamps) as transcriber:
+        transcribe_audio(
+            args.audio_path, args.destination, transcriber, None if args.no_cache else args.cache_dir,
+            (*export.DEFAULT_FORMATS, *args.export)
+        )
\ No newline at end of file
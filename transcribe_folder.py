@@ -1,6 +1,15 @@
 import os
 import argparse
+import multiprocessing
+import socket
+import time
+from functools import partial
 from transcribe import transcribe_audio
+from wavfile import WavError, read_header
+from transcriber import DEFAULT_MODEL, checkpoint_path, init_worker, make_transcriber, speed_key, worker_transcriber
+import throughput
+import content_cache
+import export
 
 def find_files_to_transcribe(root_dir):
     """Find all .wav files."""
@@ -15,29 +24,196 @@ def find_files_to_transcribe(root_dir):
                 files.append(file_path)
     return files
 
-def main(root_dir):
+def audio_duration(audio_file):
+    """Duration in seconds from the WAV header, or 0 if it cannot be read."""
+    try:
+        return read_header(audio_file).duration
+    except (WavError, OSError):
+        return 0
+
+def lock_path(audio_file):
+    """Hidden lock file next to the audio file, marking it as being transcribed."""
+    dirpath, filename = os.path.split(audio_file)
+    return os.path.join(dirpath, f".{filename}.lock")
+
+def claim(audio_file):
+    """Atomically claim a file for transcription. Returns False if another worker holds it."""
+    path = lock_path(audio_file)
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not remove_stale_lock(path):
+                return False
+            continue
+        with os.fdopen(fd, 'w') as lock_file:
+            lock_file.write(f"{socket.gethostname()} {os.getpid()}\n")
+        return True
+    return False
+
+def remove_stale_lock(path):
+    """Remove a lock left behind by a dead process on this host. Returns True if removed."""
+    try:
+        with open(path, 'r') as lock_file:
+            host, pid = lock_file.read().split()
+        if host != socket.gethostname():
+            return False
+        os.kill(int(pid), 0)
+        return False
+    except ProcessLookupError:
+        pass
+    except (OSError, ValueError):
+        return False
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    return True
+
+def release(audio_file):
+    try:
+        os.remove(lock_path(audio_file))
+    except FileNotFoundError:
+        pass
+
+def transcribe_claimed(audio_file, transcriber, cache_dir=content_cache.DEFAULT_CACHE_DIR, export_formats=export.DEFAULT_FORMATS):
+    """Transcribe a file unless it is done or claimed elsewhere.
+
+    Returns (audio_file, status, transcribed seconds of audio).
+    """
+    json_file = audio_file.replace('.wav', '.json')
+    if os.path.exists(json_file):
+        return audio_file, "skipped", 0
+    if not claim(audio_file):
+        print(f"Skipping {audio_file}, claimed by another worker.")
+        return audio_file, "claimed", 0
+    try:
+        # Another worker may have finished it between our check and the claim
+        if os.path.exists(json_file):
+            return audio_file, "skipped", 0
+        json_data = transcribe_audio(audio_file, transcriber, cache_dir, export_formats)
+        return audio_file, "done", json_data["duration"] * 60
+    except Exception as e:
+        print(f"Error transcribing {audio_file}: {e}")
+        return audio_file, "failed", 0
+    finally:
+        release(audio_file)
+
+def transcribe_in_worker(audio_file, cache_dir=content_cache.DEFAULT_CACHE_DIR, export_formats=export.DEFAULT_FORMATS):
+    return transcribe_claimed(audio_file, worker_transcriber(), cache_dir, export_formats)
+
+def main(root_dir, model_name=DEFAULT_MODEL, workers=1, threads=None, chunk_minutes=None, cache_dir=content_cache.DEFAULT_CACHE_DIR, export_formats=export.DEFAULT_FORMATS,
+         word_timestamps=False):
     audio_files = find_files_to_transcribe(root_dir)
-    
+
     total_files = len(audio_files)
     if total_files == 0:
         print("No .wav files found.")
         return
-    
-    print(f"Found {total_files} .wav files. Starting transcription...")
-    
-    # Transcribe each file and track progress
-    for i, audio_file in enumerate(audio_files, start=1):
-        json_file = audio_file.replace('.wav', '.json')
-        if os.path.exists(json_file):
-            print(f"Skipping {audio_file}, transcription already exists.")
-            continue
-        
-        print(f"Transcribing audio file {i}/{total_files}...")
-        transcribe_audio(audio_file)
+
+    pending = [f for f in audio_files if not os.path.exists(f.replace('.wav', '.json'))]
+    print(f"Found {total_files} .wav files, {total_files - len(pending)} already transcribed.")
+    if not pending:
+        return
+
+    # Files interrupted in an earlier run resume from their checkpoint first, then
+    # longest files first, so the pool does not end waiting on one long straggler
+    resumable = {f for f in pending if os.path.exists(checkpoint_path(f.replace('.wav', '.json')))}
+    if resumable:
+        print(f"{len(resumable)} partially transcribed file(s) will resume from their checkpoint.")
+    durations = {f: audio_duration(f) for f in pending}
+    pending.sort(key=lambda f: (f not in resumable, -durations[f]))
+
+    if not chunk_minutes:
+        workers = max(1, min(workers, len(pending)))
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+    if chunk_minutes and workers > 1:
+        print(f"Starting transcription of {len(pending)} files, each split across {workers} workers with {threads} thread(s) each...")
+    else:
+        print(f"Starting transcription of {len(pending)} files with {workers} worker(s), {threads} thread(s) each...")
+
+    # Batch ETA from the rolling speed of earlier runs; once files complete, from this run's speed.
+    # With files in parallel each worker records its own, contended, per-file speed
+    parallel_files = 1 if workers == 1 or chunk_minutes else workers
+    if parallel_files > 1:
+        key = speed_key(model_name, 1, threads, parallel_files)
+    else:
+        key = speed_key(model_name, workers, threads)
+    estimated_speed = throughput.estimate(key) * parallel_files
+    remaining_seconds = sum(durations.values())
+    print(
+        f"{remaining_seconds / 60:.1f} minutes of audio at about {estimated_speed:.2f}x real time, "
+        f"estimated time: {throughput.format_eta(remaining_seconds / estimated_speed)}"
+    )
+
+    start_time = time.time()
+    counts = {"done": 0, "skipped": 0, "claimed": 0, "failed": 0}
+    transcribed_seconds = 0
+
+    def report_progress(audio_file):
+        nonlocal remaining_seconds
+        remaining_seconds -= durations[audio_file]
+        elapsed = time.time() - start_time
+        speed = transcribed_seconds / elapsed if transcribed_seconds > 0 else estimated_speed
+        print(
+            f"Batch: {remaining_seconds / 60:.1f} minutes of audio left at {speed:.2f}x real time, "
+            f"remaining: {throughput.format_eta(remaining_seconds / speed)}"
+        )
+
+    if workers == 1 or chunk_minutes:
+        # The model is loaded once, on the first file that needs it, and reused for the rest
+        transcriber = None
+        for i, audio_file in enumerate(pending, start=1):
+            if os.path.exists(audio_file.replace('.wav', '.json')):
+                print(f"Skipping {audio_file}, transcription already exists.")
+                counts["skipped"] += 1
+                report_progress(audio_file)
+                continue
+            if transcriber is None:
+                transcriber = make_transcriber(model_name, workers, threads, chunk_minutes, word_timestamps)
+            print(f"Transcribing audio file {i}/{len(pending)}...")
+            _, status, seconds = transcribe_claimed(audio_file, transcriber, cache_dir, export_formats)
+            counts[status] += 1
+            transcribed_seconds += seconds
+            report_progress(audio_file)
+        if transcriber is not None:
+            transcriber.close()
+    else:
+        # Each worker process holds its own model; the pool hands out files in
+        # queue order as workers become free
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers, initializer=init_worker, initargs=(model_name, threads, word_timestamps, workers)) as pool:
+            results = pool.imap_unordered(partial(transcribe_in_worker, cache_dir=cache_dir, export_formats=export_formats), pending, chunksize=1)
+            for i, (audio_file, status, seconds) in enumerate(results, start=1):
+                counts[status] += 1
+                transcribed_seconds += seconds
+                print(f"[{i}/{len(pending)}] {status}: {audio_file}")
+                report_progress(audio_file)
+
+    elapsed_time = time.time() - start_time
+    print(
+        f"Transcribed {counts['done']} files ({transcribed_seconds / 60:.2f} minutes of audio) "
+        f"in {elapsed_time / 60:.2f} minutes; skipped {counts['skipped'] + counts['claimed']}, failed {counts['failed']}."
+    )
+    if elapsed_time > 0:
+        print(f"Throughput: {transcribed_seconds / elapsed_time:.2f} seconds of audio per second.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Transcribe all .wav files in a given directory.")
     parser.add_argument("root_directory", type=str, help="Root directory to scan for audio files.")
+    parser.add_argument("-m", "--model", type=str, default=DEFAULT_MODEL, help=f"Whisper model to use (default: {DEFAULT_MODEL}).")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of worker processes, each loading its own model (default: 1). Files are transcribed in parallel, or chunks of one file with --chunk-minutes.")
+    parser.add_argument("-t", "--threads", type=int, help="Torch threads per worker (default: CPU cores divided by workers).")
+    parser.add_argument("-c", "--chunk-minutes", type=float, help="Transcribe long recordings in chunks of about this length, cut at silences.")
+    parser.add_argument("--cache-dir", type=str, default=content_cache.DEFAULT_CACHE_DIR, help=f"Cache of transcripts by audio content, reused for renamed or duplicated recordings (default: {content_cache.DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--no-cache", action="store_true", help="Neither use nor fill the transcript cache.")
+    parser.add_argument("--word-timestamps", action="store_true", help="Also record when each word starts and ends, in a .words file next to each .json.")
+    parser.add_argument("-e", "--export", nargs="+", choices=["srt", "vtt"], default=[], help="Also write subtitles in these formats next to each .txt.")
     args = parser.parse_args()
-    
-    main(args.root_directory)
\ No newline at end of file
+
+    main(
+        args.root_directory, args.model, args.workers, args.threads, args.chunk_minutes,
+        None if args.no_cache else args.cache_dir, (*export.DEFAULT_FORMATS, *args.export), args.word_timestamps
+    )
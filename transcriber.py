@@ -0,0 +1,510 @@
+import os
+import sys
+import json
+import time
+import itertools
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import torch
+import whisper
+from jsonfile import write_json
+import throughput
+import content_cache
+import export
+from metrics import StageTimer, log_event
+from peaks import try_write_peaks
+from words import try_write_words
+
+DEFAULT_MODEL = "medium"
+
+# Beam search width; set to 1 to disable beam search (30-50% faster)
+BEAM_SIZE = 5
+
+# Decoding options passed to whisper; word_timestamps is set per Transcriber
+WHISPER_OPTIONS = dict(
+    word_timestamps=False,  # True enables word-level timestamps, stored in the .words sidecar
+    temperature=0.2,  # set to 0 for deterministic results (5-10% faster)
+    beam_size=BEAM_SIZE,
+    fp16=False          # set to True to use mixed-precision (GPU only)
+)
+
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+
+# Bytes read from ffmpeg per pipe read
+READ_SIZE = 1 << 20
+
+# Default chunk length for long recordings in chunked mode
+DEFAULT_CHUNK_SECONDS = 600
+
+# Chunk boundaries are moved to the quietest frame within this many seconds
+SILENCE_SEARCH_SECONDS = 30
+
+# Length of the frames over which the energy is measured
+FRAME_SECONDS = 0.05
+
+def load_audio(audio_path, sample_rate=SAMPLE_RATE):
+    """Decode any audio file to mono float32 PCM in a single ffmpeg pass.
+
+    The PCM is streamed from ffmpeg's stdout straight into a NumPy buffer, with
+    no intermediate file. Returns (audio, duration in seconds); the duration is
+    taken from the decoded samples, so no separate probe is needed.
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-v", "error", "-threads", "0",
+        "-i", audio_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate),
+        "-"
+    ]
+    # stderr goes to a file: a pipe that is only read at the end would fill up
+    # on long warning output and block ffmpeg while we wait for stdout
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+
+        audio = np.empty(sample_rate * 60, dtype=np.float32)
+        length = 0
+        pending = b""
+        with process.stdout:
+            while True:
+                chunk = process.stdout.read(READ_SIZE)
+                if not chunk:
+                    break
+                chunk = pending + chunk
+                # Keep an odd trailing byte for the next read
+                usable = len(chunk) - len(chunk) % 2
+                pending = chunk[usable:]
+                samples = np.frombuffer(chunk[:usable], dtype=np.int16)
+                if length + len(samples) > len(audio):
+                    audio = np.resize(audio, max(2 * len(audio), length + len(samples)))
+                audio[length:length + len(samples)] = samples
+                length += len(samples)
+
+        if process.wait() != 0:
+            stderr.seek(0)
+            message = stderr.read().decode(errors='replace').strip()
+            raise RuntimeError(f"Failed to decode {audio_path}: {message}")
+
+    audio = audio[:length]
+    audio /= 32768.0
+    return audio, length / sample_rate
+
+def split_on_silence(audio, chunk_seconds, sample_rate=SAMPLE_RATE):
+    """Split audio into chunks of about chunk_seconds, cutting at quiet moments.
+
+    Each cut is placed at the frame with the lowest RMS energy within
+    SILENCE_SEARCH_SECONDS (at most half a chunk) of the nominal chunk end.
+    Returns a list of (start, end) sample offsets covering the whole array.
+    """
+    frame = int(FRAME_SECONDS * sample_rate)
+    chunk = max(2 * frame, int(chunk_seconds * sample_rate))
+    # Searching a whole chunk back could put the cut where the chunk started
+    search = min(int(SILENCE_SEARCH_SECONDS * sample_rate), chunk // 2)
+    if len(audio) <= chunk + search:
+        return [(0, len(audio))]
+
+    n_frames = len(audio) // frame
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    # einsum avoids materialising a squared copy of the whole recording
+    energy = np.einsum('ij,ij->i', frames, frames)
+
+    boundaries = [0]
+    while len(audio) - boundaries[-1] > chunk + search:
+        target = boundaries[-1] + chunk
+        low = (target - search) // frame
+        high = min(n_frames, (target + search) // frame)
+        quietest = low + int(np.argmin(energy[low:high]))
+        boundaries.append(quietest * frame + frame // 2)
+    boundaries.append(len(audio))
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def shift_segments(segments, offset):
+    """Move segments transcribed from a chunk, and their words, to their position in the whole recording."""
+    shifted = []
+    for segment in segments:
+        segment = dict(segment)
+        segment["start"] += offset
+        segment["end"] += offset
+        if "words" in segment:
+            segment["words"] = [
+                dict(word, start=word["start"] + offset, end=word["end"] + offset) for word in segment["words"]
+            ]
+        shifted.append(segment)
+    return shifted
+
+def checkpoint_path(json_path):
+    """Hidden checkpoint sidecar holding the partial transcript of json_path."""
+    dirpath, filename = os.path.split(json_path)
+    return os.path.join(dirpath, f".{os.path.splitext(filename)[0]}.checkpoint.json")
+
+def load_checkpoint(path, model_name, samples):
+    """Return (offset in seconds, segments) saved for this recording and model, or a fresh start."""
+    if path is None or not os.path.exists(path):
+        return 0, []
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable checkpoint {path}: {e}")
+        return 0, []
+    if checkpoint.get("model") != model_name or checkpoint.get("samples") != samples:
+        print(f"Ignoring checkpoint {path}, it was made for another model or recording.")
+        return 0, []
+    return checkpoint["offset"], checkpoint["segments"]
+
+def transcribe_in_windows(audio, chunk_seconds, transcribe_chunks, checkpoint=None, model_name=None, throughput_key=None):
+    """Transcribe audio window by window and join the results in whisper's format.
+
+    transcribe_chunks maps an iterable of (offset, samples) to (offset, end, result)
+    in order. With a checkpoint path, the segments are saved after every window
+    and a later run resumes after the last completed one. Progress is printed
+    after every window; with a throughput_key the measured speed is recorded.
+    """
+    offset, segments = load_checkpoint(checkpoint, model_name, len(audio))
+    if offset:
+        print(f"Resuming from checkpoint at {offset / 60:.2f} minutes.")
+
+    start = int(round(offset * SAMPLE_RATE))
+    chunks = (
+        (offset + chunk_offset, chunk)
+        for chunk_offset, chunk in audio_chunks(audio[start:], chunk_seconds)
+    )
+    total = len(audio) / SAMPLE_RATE
+    started = time.time()
+    for chunk_offset, chunk_end, result in transcribe_chunks(chunks):
+        segments.extend(shift_segments(result["segments"], chunk_offset))
+        if checkpoint is not None:
+            write_json(checkpoint, {
+                "model": model_name,
+                "samples": len(audio),
+                "offset": chunk_end,
+                "segments": segments
+            }, indent=None)
+
+        # Remaining time at the speed measured so far in this run
+        elapsed = time.time() - started
+        if elapsed > 0 and chunk_end > offset:
+            speed = (chunk_end - offset) / elapsed
+            print(
+                f"Transcribed {chunk_end / 60:.1f} of {total / 60:.1f} minutes at {speed:.2f}x real time, "
+                f"remaining: {throughput.format_eta((total - chunk_end) / speed)}"
+            )
+
+    if throughput_key is not None:
+        throughput.record(throughput_key, total - offset, time.time() - started)
+
+    for index, segment in enumerate(segments):
+        segment["id"] = index
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments
+    }
+
+def audio_chunks(audio, chunk_seconds, sample_rate=SAMPLE_RATE):
+    """Yield (offset in seconds, samples) for every chunk of a recording."""
+    for start, end in split_on_silence(audio, chunk_seconds, sample_rate):
+        yield start / sample_rate, audio[start:end]
+
+class Transcriber:
+    """A whisper model, kept in memory to transcribe any number of files.
+
+    Loading the model takes longer than transcribing a short clip, so batch
+    scripts create one Transcriber and pass it to every transcribe_audio() call.
+    The model is loaded on first use, so files served from the transcript cache
+    never wait for it. With chunk_seconds set, long recordings are transcribed
+    in chunks cut at silences (see TranscriberPool for doing that in parallel).
+    Given a checkpoint path, they always are, so that an interrupted run can resume.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, device=None, chunk_seconds=None, word_timestamps=False, parallel_files=1, progress=True):
+        self.model_name = model_name
+        self.chunk_seconds = chunk_seconds
+        self.requested_device = device
+        self._model = None
+        self.options = dict(WHISPER_OPTIONS, word_timestamps=word_timestamps)
+        # Whisper's own progress bar (verbose=False) shows progress within each
+        # window, so recordings shorter than a window report progress too. It is
+        # only drawn on a terminal, and never by pool workers drawing over each other.
+        self.verbose = False if progress and sys.stderr.isatty() else None
+        # Measured speeds are kept per model, beam size, thread budget and host, and
+        # by the number of files transcribed alongside (transcribe_folder.py --workers)
+        self.throughput_key = throughput.stats_key(
+            model_name, self.options["beam_size"], 1, torch.get_num_threads(), parallel_files
+        )
+
+    def load(self):
+        """Load the model now instead of on first use."""
+        self.model
+
+    @property
+    def model(self):
+        if self._model is None:
+            print(f"Loading whisper model '{self.model_name}'...")
+            start = time.perf_counter()
+            self._model = whisper.load_model(self.model_name, device=self.requested_device)
+            log_event(
+                "model_load", model=self.model_name, device=str(self._model.device),
+                seconds=round(time.perf_counter() - start, 3)
+            )
+        return self._model
+
+    def settings(self):
+        """Everything that shapes the transcript, for the content-addressed transcript cache."""
+        return {
+            "model": self.model_name,
+            "options": self.options,
+            "chunk_seconds": self.chunk_seconds or DEFAULT_CHUNK_SECONDS
+        }
+
+    def transcribe(self, audio, checkpoint=None):
+        """Run whisper on a file path or a 16 kHz float32 array."""
+        chunk_seconds = self.chunk_seconds
+        if chunk_seconds is None and checkpoint is not None:
+            chunk_seconds = DEFAULT_CHUNK_SECONDS
+        if chunk_seconds is None or isinstance(audio, str):
+            return self.model.transcribe(audio, verbose=self.verbose, **self.options)
+        return transcribe_in_windows(
+            audio, chunk_seconds, self.transcribe_chunks, checkpoint, self.model_name, self.throughput_key
+        )
+
+    def transcribe_chunks(self, chunks):
+        for offset, chunk in chunks:
+            yield offset, offset + len(chunk) / SAMPLE_RATE, self.model.transcribe(chunk, verbose=self.verbose, **self.options)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Set in each worker process by init_worker()
+_worker_transcriber = None
+
+def set_thread_budget(threads):
+    """Limit the number of CPU threads torch uses for inference in this process."""
+    torch.set_num_threads(threads)
+
+def thread_budget(workers=1, threads=None):
+    """Torch threads of each of workers processes: threads, or the CPU cores shared among them."""
+    if threads:
+        return threads
+    if workers > 1:
+        return max(1, (os.cpu_count() or 1) // workers)
+    return torch.get_num_threads()
+
+def speed_key(model_name=DEFAULT_MODEL, workers=1, threads=None, parallel_files=1):
+    """Throughput key of the transcriber make_transcriber() builds from the same options.
+
+    parallel_files is the number of single-worker transcribers running at once,
+    as with transcribe_folder.py --workers.
+    """
+    return throughput.stats_key(model_name, BEAM_SIZE, workers, thread_budget(workers, threads), parallel_files)
+
+def init_worker(model_name, threads, word_timestamps=False, parallel_files=1, ready=None):
+    """Pool initializer: apply the thread budget and set up one model per worker process.
+
+    With a ready queue the model is loaded right away and the process id (or the
+    error) is put on the queue once it is.
+    """
+    global _worker_transcriber
+    set_thread_budget(threads)
+    _worker_transcriber = Transcriber(model_name, word_timestamps=word_timestamps, parallel_files=parallel_files, progress=False)
+    if ready is not None:
+        try:
+            _worker_transcriber.load()
+        except Exception as e:
+            ready.put(f"Worker {os.getpid()} could not load model '{model_name}': {e}")
+            raise
+        ready.put(os.getpid())
+
+def worker_transcriber():
+    """The Transcriber loaded by init_worker() in the current process."""
+    return _worker_transcriber
+
+def transcribe_chunk(offset_and_chunk):
+    offset, chunk = offset_and_chunk
+    return offset, offset + len(chunk) / SAMPLE_RATE, worker_transcriber().transcribe(chunk)
+
+class TranscriberPool:
+    """Worker processes, each holding a model, that transcribe chunks of one recording in parallel.
+
+    Has the same transcribe() interface as Transcriber, so it can be passed to
+    transcribe_audio() in its place. The pool is started on first use (or by
+    load()) and kept for further files until close().
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, workers=2, threads=None, chunk_seconds=DEFAULT_CHUNK_SECONDS, word_timestamps=False):
+        self.model_name = model_name
+        self.workers = workers
+        self.threads = thread_budget(workers, threads)
+        self.chunk_seconds = chunk_seconds
+        self.word_timestamps = word_timestamps
+        self.pool = None
+        self.throughput_key = throughput.stats_key(model_name, BEAM_SIZE, workers, self.threads)
+
+    def settings(self):
+        """Everything that shapes the transcript, for the content-addressed transcript cache."""
+        return {
+            "model": self.model_name,
+            "options": dict(WHISPER_OPTIONS, word_timestamps=self.word_timestamps),
+            "chunk_seconds": self.chunk_seconds
+        }
+
+    def load(self):
+        """Start the worker processes and wait until every one has loaded its model."""
+        if self.pool is not None:
+            return
+        context = multiprocessing.get_context("spawn")
+        ready = context.Queue()
+        self.pool = context.Pool(
+            self.workers, initializer=init_worker,
+            initargs=(self.model_name, self.threads, self.word_timestamps, 1, ready)
+        )
+        for _ in range(self.workers):
+            worker = ready.get()
+            if not isinstance(worker, int):
+                self.pool.terminate()
+                self.pool = None
+                raise RuntimeError(worker)
+
+    def transcribe(self, audio, checkpoint=None):
+        """Transcribe a 16 kHz float32 array, chunk by chunk across the workers."""
+        # Start the workers first, so the measured speed leaves out their startup
+        self.load()
+        return transcribe_in_windows(
+            audio, self.chunk_seconds, self.transcribe_chunks, checkpoint, self.model_name, self.throughput_key
+        )
+
+    def transcribe_chunks(self, chunks):
+        self.load()
+        # imap yields in order, so the checkpoint only ever covers a finished prefix
+        return self.pool.imap(transcribe_chunk, chunks, chunksize=1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def make_transcriber(model_name=DEFAULT_MODEL, workers=1, threads=None, chunk_minutes=None, word_timestamps=False):
+    """Build the transcriber for the command line options shared by the transcribe scripts.
+
+    With more than one worker, recordings are split into chunks (of chunk_minutes,
+    or DEFAULT_CHUNK_SECONDS) that are transcribed in parallel.
+    """
+    chunk_seconds = chunk_minutes * 60 if chunk_minutes else None
+    if workers > 1:
+        return TranscriberPool(model_name, workers, threads, chunk_seconds or DEFAULT_CHUNK_SECONDS, word_timestamps)
+    if threads:
+        set_thread_budget(threads)
+    return Transcriber(model_name, chunk_seconds=chunk_seconds, word_timestamps=word_timestamps)
+
+def remove_consecutive_duplicates(segments):
+    return [key for key, _ in itertools.groupby(segments)]
+
+def transcribe_file(audio_path, json_file_path, metadata, transcriber, cache_dir=content_cache.DEFAULT_CACHE_DIR, export_formats=export.DEFAULT_FORMATS):
+    """Transcribe one recording to json_file_path and return the JSON data written.
+
+    The pipeline shared by the transcribe scripts: the transcript cache lookup,
+    decoding with a time estimate, inference with per-window checkpoints, then the
+    .json (metadata plus "duration" and "transcript"), .words, exports and peaks.
+    Time per stage is logged as one JSON line.
+    """
+    start_time = time.time()
+    # Wall-clock time per stage, logged as one JSON line at the end
+    timer = StageTimer()
+    checkpoint = checkpoint_path(json_file_path)
+
+    # Identical audio transcribed before, under any name, comes from the cache
+    cached = None
+    if cache_dir:
+        with timer.stage("hash"):
+            key = content_cache.cache_key(audio_path, transcriber.settings())
+            cached = content_cache.lookup(cache_dir, key)
+
+    if cached is not None:
+        print("Identical audio found in the transcript cache, skipping transcription.")
+        audio_duration_seconds = cached["duration"]
+        cleaned_transcription = cached["segments"]
+    else:
+        # Decode once, whatever the format; the duration comes from the decoded samples
+        with timer.stage("decode"):
+            audio, audio_duration_seconds = load_audio(audio_path)
+        audio_duration_minutes = audio_duration_seconds / 60
+
+        # Rolling speed of earlier runs with this model and settings on this host
+        processing_speed = throughput.estimate(transcriber.throughput_key)  # Audio seconds per second
+        estimated_processing_time = audio_duration_minutes / processing_speed
+
+        print(f"Audio duration: {audio_duration_minutes:.2f} minutes")
+        print(f"Estimated processing time: {estimated_processing_time:.2f} minutes at {processing_speed:.2f}x real time")
+
+        expected_end_time = time.time() + (estimated_processing_time * 60)
+        end_time_human_readable = datetime.fromtimestamp(expected_end_time).strftime('%Y-%m-%d %H:%M:%S')
+
+        print(f"Running whisper. Expected completion time: {end_time_human_readable}")
+
+        print("Transcribing... This may take a while.")
+
+        # The model (or the pool's workers with their models) is loaded on first use
+        with timer.stage("model_load"):
+            transcriber.load()
+
+        # Partial results are checkpointed per window, so an interrupted run resumes
+        with timer.stage("inference"):
+            result = transcriber.transcribe(audio, checkpoint=checkpoint)
+
+        with timer.stage("dedupe"):
+            cleaned_transcription = remove_consecutive_duplicates(result['segments'])
+
+        # Keep the result for identical audio under other names
+        if cache_dir:
+            cached_segments = []
+            for segment in cleaned_transcription:
+                entry = {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+                if segment.get("words"):
+                    entry["words"] = [{"word": w["word"], "start": w["start"], "end": w["end"]} for w in segment["words"]]
+                cached_segments.append(entry)
+            content_cache.store(cache_dir, key, transcriber.settings(), audio_duration_seconds, cached_segments)
+
+    elapsed_time = time.time() - start_time
+
+    with timer.stage("write"):
+        json_data = dict(metadata, duration=audio_duration_seconds / 60, transcript=[
+            {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+            for segment in cleaned_transcription
+        ])
+
+        write_json(json_file_path, json_data)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        # Word timings go to a compact binary sidecar instead of the JSON
+        try_write_words(json_file_path, cleaned_transcription)
+
+        # The text file (and any subtitles) after the JSON, so they count as up to date with it
+        export_paths = export.write_exports(json_file_path, json_data["transcript"], export_formats)
+
+    print(f"Transcription completed in {elapsed_time:.2f} seconds (~{elapsed_time/60:.2f} minutes).")
+    print(f"Transcription JSON saved to {json_file_path}")
+    for path in export_paths:
+        print(f"Transcription exported to {path}")
+
+    # Precompute the waveform overview for the browser
+    if audio_path.lower().endswith(".wav"):
+        with timer.stage("peaks"):
+            try_write_peaks(audio_path)
+
+    timer.log("transcription_timing", file=audio_path, audio_seconds=round(audio_duration_seconds, 2), config=transcriber.throughput_key)
+
+    return json_data
@@ -0,0 +1,68 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 ** 2
+
+# Payloads smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+class TranscriptCache:
+    """Size-bounded LRU cache of encoded /transcription payloads.
+
+    Entries are stored per sidecar path together with a key describing the
+    version they were built from (mtime, size, journal position); a lookup
+    with a different key is a miss. Each entry keeps the JSON body and, for
+    larger payloads, a gzip-compressed copy.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, key):
+        """Return (body, gzipped body or None, etag) if cached for this key, else None."""
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[0] != key:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, path, key, body, etag):
+        gzipped = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        entry_size = len(body) + (len(gzipped) if gzipped else 0)
+        with self.lock:
+            self._remove(path)
+            if entry_size > self.max_bytes:
+                return body, gzipped, etag
+            self.entries[path] = (key, body, gzipped, etag)
+            self.size += entry_size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+        return body, gzipped, etag
+
+    def invalidate(self, path):
+        with self.lock:
+            self._remove(path)
+
+    def _remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[1]) + (len(entry[2]) if entry[2] else 0)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
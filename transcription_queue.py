@@ -0,0 +1,141 @@
+import os
+import time
+import socket
+
+import throughput
+
+# Files asked for in the browser go before files found by the watcher;
+# within a priority, shorter files go first
+PRIORITY_REQUESTED = 0
+PRIORITY_WATCHED = 1
+
+# Finished jobs kept for the status list
+KEEP_FINISHED = 100
+
+# Order in which queued jobs are handed out
+QUEUE_ORDER = "priority, duration, enqueued"
+
+def worker_id():
+    return f"{socket.gethostname()} {os.getpid()}"
+
+def enqueue(conn, audio_path, duration, requested=False):
+    """Queue a recording, given its path relative to the audio folder and its duration in seconds.
+
+    Queuing a file again keeps its place but can raise its priority; finished
+    or failed jobs are queued anew. Running jobs are left alone.
+    """
+    priority = PRIORITY_REQUESTED if requested else PRIORITY_WATCHED
+    with conn:
+        conn.execute(
+            "INSERT INTO queue (path, priority, duration, state, enqueued) VALUES (?, ?, ?, 'queued', ?) "
+            "ON CONFLICT(path) DO UPDATE SET "
+            "priority = CASE WHEN state = 'queued' THEN MIN(priority, excluded.priority) ELSE excluded.priority END, "
+            "enqueued = CASE WHEN state = 'queued' THEN enqueued ELSE excluded.enqueued END, "
+            "duration = excluded.duration, state = 'queued', "
+            "started = NULL, finished = NULL, speed = NULL, worker = NULL, error = NULL "
+            "WHERE state != 'running'",
+            (audio_path, priority, duration, time.time())
+        )
+
+def claim_next(conn, speed, worker=None):
+    """Mark the first queued job as running and return its row, or None if the queue is empty.
+
+    speed is the audio seconds per second the worker expects, for the ETA of the job.
+    """
+    worker = worker or worker_id()
+    while True:
+        row = conn.execute(
+            f"SELECT * FROM queue WHERE state = 'queued' ORDER BY {QUEUE_ORDER} LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            # Another worker may have claimed it since the select
+            claimed = conn.execute(
+                "UPDATE queue SET state = 'running', started = ?, speed = ?, worker = ? "
+                "WHERE path = ? AND state = 'queued'",
+                (time.time(), speed, worker, row["path"])
+            ).rowcount
+        if claimed:
+            return row
+
+def finish(conn, audio_path, error=None):
+    """Record the end of a job; error is None on success."""
+    with conn:
+        conn.execute(
+            "UPDATE queue SET state = ?, finished = ?, error = ? WHERE path = ?",
+            ("failed" if error else "done", time.time(), error, audio_path)
+        )
+        conn.execute(
+            "DELETE FROM queue WHERE state = 'done' AND path NOT IN "
+            "(SELECT path FROM queue WHERE state = 'done' ORDER BY finished DESC LIMIT ?)",
+            (KEEP_FINISHED,)
+        )
+
+def requeue_abandoned(conn):
+    """Queue again the running jobs of workers on this host that no longer exist."""
+    host = socket.gethostname()
+    abandoned = []
+    for row in conn.execute("SELECT path, worker FROM queue WHERE state = 'running'"):
+        try:
+            worker_host, pid = row["worker"].split()
+            if worker_host != host:
+                continue
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            abandoned.append(row["path"])
+        except (AttributeError, OSError, ValueError):
+            continue
+    with conn:
+        conn.executemany(
+            "UPDATE queue SET state = 'queued', started = NULL, speed = NULL, worker = NULL WHERE path = ?",
+            ((path,) for path in abandoned)
+        )
+    return abandoned
+
+def jobs(conn):
+    """Running, queued and recently finished jobs, each with the seconds until it is done.
+
+    Queued jobs are estimated in queue order, assuming the running workers
+    share them evenly, at the speed the workers reported for their current jobs.
+    """
+    rows = conn.execute(
+        "SELECT * FROM queue WHERE state IN ('running', 'queued') "
+        f"ORDER BY state = 'queued', {QUEUE_ORDER}"
+    ).fetchall()
+    rows += conn.execute(
+        "SELECT * FROM queue WHERE state IN ('done', 'failed') ORDER BY finished DESC"
+    ).fetchall()
+    running = [row for row in rows if row["state"] == "running"]
+    last_speed = conn.execute(
+        "SELECT speed FROM queue WHERE speed IS NOT NULL ORDER BY started DESC LIMIT 1"
+    ).fetchone()
+    speed = last_speed["speed"] if last_speed else throughput.DEFAULT_SPEED
+
+    now = time.time()
+    lanes = max(1, len(running))
+    wait = 0
+    position = 0
+    result = []
+    for row in rows:
+        job = {
+            "file": row["path"],
+            "state": row["state"],
+            "requested": row["priority"] == PRIORITY_REQUESTED,
+            "duration": row["duration"],
+            "enqueued": row["enqueued"],
+            "started": row["started"],
+            "finished": row["finished"],
+            "error": row["error"]
+        }
+        if row["state"] == "running":
+            left = max(0, row["duration"] / (row["speed"] or speed) - (now - row["started"]))
+            job["eta_seconds"] = round(left)
+            wait += left / lanes
+        elif row["state"] == "queued":
+            position += 1
+            wait += row["duration"] / speed / lanes
+            job["position"] = position
+            job["eta_seconds"] = round(wait)
+        result.append(job)
+    return result
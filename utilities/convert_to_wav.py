@@ -1,42 +1,183 @@
 import os
+import sys
+import json
+import tempfile
 import subprocess
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Share the WAV header reader and atomic JSON writer of the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jsonfile import write_json
+from wavfile import WavError, read_header
+
+# Hidden file in the converted folder recording what has been converted
+MANIFEST_NAME = ".convert_manifest.json"
+
+# A converted WAV may differ from its source by this many seconds
+DURATION_TOLERANCE = 0.5
+
+# Audio formats converted to WAV, as accepted by transcribe_audio.py; sidecars such as
+# .json, .txt, .srt, .peaks or .words next to the recordings are left alone
+SOURCE_EXTENSIONS = (".mp3", ".flac", ".aac", ".ogg", ".opus", ".m4a", ".aiff", ".aif", ".wma")
+
+# The manifest is saved after this many conversions, so an interrupted run loses little
+SAVE_EVERY = 20
+
+def source_duration(input_file):
+    """Duration in seconds reported by ffprobe, or None if unknown."""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", input_file],
+            capture_output=True, text=True
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError):
+        return None
+
+def validate_wav(output_file, expected_duration=None):
+    """Return None if output_file is a complete WAV, else the reason it is not."""
+    try:
+        info = read_header(output_file)
+    except (WavError, OSError) as e:
+        return str(e)
+    if info.frames == 0:
+        return "no audio frames"
+    if expected_duration is not None and abs(info.duration - expected_duration) > DURATION_TOLERANCE:
+        return f"{info.duration:.2f} s long, source is {expected_duration:.2f} s"
+    return None
+
+def temp_path(output_file):
+    """A new, unique hidden file next to output_file to convert into."""
+    dirpath, filename = os.path.split(os.path.abspath(output_file))
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{filename}.", suffix=".converting", dir=dirpath)
+    os.close(fd)
+    return tmp_file
 
 def convert_to_wav(input_file, output_file):
-    """Convert an audio file to WAV format using FFmpeg."""
+    """Convert an audio file to WAV format using FFmpeg.
+
+    The WAV is written to a hidden temporary file, checked against the source
+    duration and only then renamed into place. Returns True on success.
+    """
     try:
-        subprocess.run(["ffmpeg", "-i", input_file, "-acodec", "pcm_s16le", "-ar", "44100", output_file], 
+        tmp_file = temp_path(output_file)
+    except OSError as e:
+        print(f"Error converting {input_file}: {e}")
+        return False
+    try:
+        subprocess.run(["ffmpeg", "-nostdin", "-y", "-i", input_file, "-acodec", "pcm_s16le", "-ar", "44100", "-f", "wav", tmp_file],
                        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        problem = validate_wav(tmp_file, source_duration(input_file))
+        if problem:
+            print(f"Error converting {input_file}: output is invalid ({problem})")
+            return False
+        os.replace(tmp_file, output_file)
         print(f"Converted: {input_file} -> {output_file}")
-    except subprocess.CalledProcessError as e:
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
         print(f"Error converting {input_file}: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def find_sources(folder):
+    """All audio files in SOURCE_EXTENSIONS below folder, with the WAV each converts to.
 
-def process_folder(folder):
-    """Recursively process a folder to find and convert non-WAV audio files."""
+    Sources that would convert to the same WAV (a.mp3 and a.flac both to a.wav)
+    are skipped with a warning, as neither can be picked safely.
+    """
+    by_output = {}
     for root, _, files in os.walk(folder):
-        for file in files:
+        for file in sorted(files):
+            if file.startswith('.') or not file.lower().endswith(SOURCE_EXTENSIONS):
+                continue
             file_path = os.path.join(root, file)
-            if file.lower().endswith(".wav"):
+            by_output.setdefault(os.path.splitext(file_path)[0] + ".wav", []).append(file_path)
+
+    sources = []
+    for output_file, input_files in by_output.items():
+        if len(input_files) > 1:
+            print(f"Skipping {', '.join(input_files)}: all would convert to {output_file}")
+            continue
+        sources.append((input_files[0], output_file))
+    return sources
+
+def load_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def manifest_entry(input_file, output_file):
+    stat = os.stat(input_file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "output_size": os.path.getsize(output_file)}
+
+def is_converted(entry, input_file, output_file):
+    """Whether the manifest shows output_file as converted from the current version of input_file."""
+    if entry is None:
+        return False
+    try:
+        stat = os.stat(input_file)
+        output_size = os.path.getsize(output_file)
+    except FileNotFoundError:
+        return False
+    return (entry["size"], entry["mtime_ns"], entry["output_size"]) == (stat.st_size, stat.st_mtime_ns, output_size)
+
+def process_folder(folder, jobs=None):
+    """Recursively convert the non-WAV audio files of a folder, jobs ffmpeg processes at a time."""
+    manifest = load_manifest(folder)
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+
+    pending = []
+    for input_file, output_file in find_sources(folder):
+        key = os.path.relpath(input_file, folder)
+        if is_converted(manifest.get(key), input_file, output_file):
+            continue
+        if key not in manifest and os.path.exists(output_file):
+            # Converted before the manifest existed; keep it if it is complete
+            if validate_wav(output_file, source_duration(input_file)) is None:
+                manifest[key] = manifest_entry(input_file, output_file)
                 continue
-            
-            output_file = os.path.splitext(file_path)[0] + ".wav"
-            
-            if not os.path.exists(output_file):
-                convert_to_wav(file_path, output_file)
+            print(f"Redoing incomplete conversion: {output_file}")
+        pending.append((key, input_file, output_file))
+
+    print(f"{len(pending)} file(s) to convert.")
+    failed = 0
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        futures = {
+            executor.submit(convert_to_wav, input_file, output_file): (key, input_file, output_file)
+            for key, input_file, output_file in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            key, input_file, output_file = futures[future]
+            if future.result():
+                manifest[key] = manifest_entry(input_file, output_file)
+            else:
+                manifest.pop(key, None)
+                failed += 1
+            if done % SAVE_EVERY == 0:
+                write_json(manifest_path, manifest)
+
+    write_json(manifest_path, manifest)
+    return failed
 
-def main(root_dir):
+def main(root_dir, jobs=None):
     folder = root_dir.strip()
-    
+
     if not os.path.isdir(folder):
         print("Invalid folder path.")
         return
-    
-    process_folder(folder)
-    print("Processing complete.")
+
+    failed = process_folder(folder, jobs)
+    print(f"Processing complete. {failed} file(s) failed." if failed else "Processing complete.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process a specified folder.")
     parser.add_argument("folder", type=str, help="Path to the folder to process")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of parallel conversions (default: number of CPU cores)")
     args = parser.parse_args()
-    main(args.folder)
-
+    main(args.folder, args.jobs)
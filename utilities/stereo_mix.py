@@ -1,40 +1,68 @@
 import os
 import subprocess
 import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Share the WAV reader of the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wavfile import WavError, read_header, mix_to_stereo
 
 ROOT_DIR = ""
 
 # valid mono file extensions
 AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".aac", ".ogg", ".m4a")
 
+OUTPUT_NAME = "mixed_stereo.wav"
+
 def find_audio_files(folder):
     """Find all mono audio files in a given folder."""
-    mono_files = [f for f in os.listdir(folder) if f.lower().endswith(AUDIO_EXTENSIONS)]
+    mono_files = [
+        f for f in sorted(os.listdir(folder))
+        if f.lower().endswith(AUDIO_EXTENSIONS) and not f.startswith('.') and f != OUTPUT_NAME
+    ]
     mono_files = [os.path.join(folder, f) for f in mono_files]
-    
-    # Filter only mono files (FFmpeg check)
+
+    # Filter only mono files
     mono_files = [f for f in mono_files if is_mono(f)]
-    
+
     return mono_files
 
-def is_mono(file_path):
-    """Check if an audio file is mono using FFmpeg."""
+def channel_count(file_path):
+    """Number of audio channels, read from the header of WAV files and from ffprobe otherwise."""
+    if file_path.lower().endswith(".wav"):
+        try:
+            return read_header(file_path).channels
+        except (WavError, OSError):
+            pass  # e.g. a compressed codec in a WAV container; let ffprobe decide
     try:
         result = subprocess.run(
             ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=channels",
              "-of", "csv=p=0", file_path],
             capture_output=True, text=True
         )
-        return result.stdout.strip() == "1"  # Mono if output is "1"
-    except Exception as e:
+        return int(result.stdout.strip())
+    except (OSError, ValueError) as e:
         print(f"Error checking {file_path}: {e}")
+        return None
+
+def is_mono(file_path):
+    """Check if an audio file is mono."""
+    return channel_count(file_path) == 1
+
+def is_up_to_date(output_file, mono_files):
+    """Whether output_file exists and is newer than all of its inputs."""
+    try:
+        output_mtime = os.path.getmtime(output_file)
+    except FileNotFoundError:
         return False
+    return all(os.path.getmtime(f) <= output_mtime for f in mono_files)
 
-def mixdown_mono_files(mono_files, output_file):
-    """Mix multiple mono files into a stereo file using FFmpeg, force overwriting output."""
-    
-    if os.path.exists(output_file):
-        os.remove(output_file)  # Ensure clean overwrite
+def mixdown_with_ffmpeg(mono_files, output_file):
+    """Mix multiple mono files into a stereo file using FFmpeg, for formats the WAV reader cannot map."""
+    dirpath, filename = os.path.split(output_file)
+    tmp_file = os.path.join(dirpath, f".{filename}.mixing")
 
     input_args = []
     for file in mono_files:
@@ -44,39 +72,76 @@ def mixdown_mono_files(mono_files, output_file):
     filter_complex = f"{''.join([f'[{i}:a]' for i in range(len(mono_files))])}amix=inputs={len(mono_files)}:normalize=0[aout]"
 
     cmd = [
-        "ffmpeg", *input_args,
+        "ffmpeg", "-nostdin", *input_args,
         "-filter_complex", filter_complex,
         "-map", "[aout]",  # output mapping
         "-ac", "2",
+        "-f", "wav",
         "-y",  # overwrite output
-        output_file
+        tmp_file
     ]
 
     try:
-        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def mixdown_mono_files(mono_files, output_file):
+    """Mix multiple mono files into a stereo file, in process when all of them are PCM WAV files.
+
+    Returns True on success.
+    """
+    try:
+        try:
+            mix_to_stereo(mono_files, output_file)
+        except WavError:
+            # Compressed formats, or sample rates that differ and need resampling
+            mixdown_with_ffmpeg(mono_files, output_file)
         print(f"Mixed down to: {output_file}")
-    except subprocess.CalledProcessError as e:
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
         print(f"Error processing {mono_files}: {e}")
+        return False
 
-def process_folders(root_dir):
-    """Cycle through all subdirectories and mix mono files if needed."""
-    for folder, _, _ in os.walk(root_dir):
-        mono_files = find_audio_files(folder)
-
-        if len(mono_files) in [3, 4]:
-            output_file = os.path.join(folder, "mixed_stereo.wav")
-            
-            if not os.path.exists(output_file):  # Avoid overwriting
-                print(f"Mixing {len(mono_files)} mono files in {folder}...")
-                mixdown_mono_files(mono_files, output_file)
-            else:
-                print(f"⚠️ Stereo file already exists in {folder}, reprocessing...")
-                mixdown_mono_files(mono_files, output_file)
+def process_folder(folder):
+    """Mix the mono files of one folder if there are 3 or 4 of them and the mix is stale.
+
+    Returns False if mixing failed.
+    """
+    mono_files = find_audio_files(folder)
+    if len(mono_files) not in [3, 4]:
+        return True
+
+    output_file = os.path.join(folder, OUTPUT_NAME)
+    if is_up_to_date(output_file, mono_files):
+        print(f"Stereo file in {folder} is up to date, skipping.")
+        return True
+
+    print(f"Mixing {len(mono_files)} mono files in {folder}...")
+    return mixdown_mono_files(mono_files, output_file)
+
+def process_folders(root_dir, jobs=None):
+    """Cycle through all subdirectories and mix mono files if needed, jobs folders at a time."""
+    folders = [folder for folder, _, _ in os.walk(root_dir)]
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        futures = [executor.submit(process_folder, folder) for folder in folders]
+        for future in as_completed(futures):
+            if not future.result():
+                failed += 1
+    return failed
 
 if __name__ == "__main__":
-    if not os.path.exists(ROOT_DIR):
-        print(f"Error: Root directory '{ROOT_DIR}' not found.")
+    parser = argparse.ArgumentParser(description="Mix the mono tracks of multitrack recordings down to stereo.")
+    parser.add_argument("root_dir", type=str, nargs="?", default=ROOT_DIR, help="Folder to search for mono tracks")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of folders mixed in parallel (default: number of CPU cores)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root_dir):
+        print(f"Error: Root directory '{args.root_dir}' not found.")
         sys.exit(1)
 
-    process_folders(ROOT_DIR)
-    print("All folders processed!")
\ No newline at end of file
+    failed = process_folders(args.root_dir, args.jobs)
+    print(f"All folders processed! {failed} folder(s) failed." if failed else "All folders processed!")
@@ -0,0 +1,214 @@
+import os
+import time
+import argparse
+import threading
+from contextlib import closing
+
+import archive_index
+import transcription_queue
+import throughput
+import content_cache
+import export
+from transcribe_folder import transcribe_claimed
+from transcriber import DEFAULT_MODEL, make_transcriber, speed_key
+from wavfile import WavError, read_header
+
+try:
+    # inotify (or the platform's equivalent) through watchdog, if installed
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Seconds a file's size and mtime must stay unchanged before it counts as copied
+SETTLE_SECONDS = 10
+
+# Seconds between full scans of the folder when polling, and between checks of the queue
+POLL_INTERVAL = 30
+QUEUE_INTERVAL = 2
+
+def is_recording(path):
+    filename = os.path.basename(path)
+    return filename.endswith(".wav") and not filename.startswith(".")
+
+class SettleTracker:
+    """Debounces recordings that may still be being copied or recorded.
+
+    Paths are added with touch() when they appear or change; poll() returns
+    those whose size and mtime have not changed for settle_seconds.
+    """
+
+    def __init__(self, settle_seconds=SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self.pending = {}   # path -> ((size, mtime_ns) or None, time first seen so)
+        self.reported = {}  # path -> (size, mtime_ns) when it was last returned by poll()
+
+    def touch(self, path, signature=None):
+        if signature is not None and self.reported.get(path) == signature:
+            return
+        if path not in self.pending:
+            self.pending[path] = (None, time.monotonic())
+
+    def poll(self):
+        now = time.monotonic()
+        settled = []
+        for path, (signature, since) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != signature:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle_seconds:
+                del self.pending[path]
+                self.reported[path] = current
+                settled.append(path)
+        return settled
+
+class RecordingEvents(FileSystemEventHandler):
+    """Hands the paths of created, modified and moved-in recordings to a SettleTracker."""
+
+    def __init__(self, tracker, lock):
+        self.tracker = tracker
+        self.lock = lock
+
+    # Only changes count: watchdog also reports opens and closes, and the browser
+    # streaming a file or the peak builder reading it must not queue it again
+    def on_created(self, event):
+        self.touch(event.src_path, event)
+
+    def on_modified(self, event):
+        self.touch(event.src_path, event)
+
+    def on_moved(self, event):
+        self.touch(event.dest_path, event)
+
+    def touch(self, path, event):
+        if event.is_directory or not is_recording(path):
+            return
+        with self.lock:
+            self.tracker.touch(path)
+
+def scan_untranscribed(audio_folder, tracker, lock):
+    """Add every recording without a transcript to the tracker."""
+    recordings, transcripts = archive_index.scan(audio_folder)
+    with lock:
+        for audio_path, stat in recordings.items():
+            if archive_index.transcript_path(audio_path) not in transcripts:
+                tracker.touch(os.path.join(audio_folder, audio_path), (stat.st_size, stat.st_mtime_ns))
+
+def watch(audio_folder, settle_seconds=SETTLE_SECONDS, poll_interval=POLL_INTERVAL, use_inotify=True):
+    """Watcher thread body: queue new recordings once they have settled."""
+    tracker = SettleTracker(settle_seconds)
+    lock = threading.Lock()
+    scan_untranscribed(audio_folder, tracker, lock)
+
+    if use_inotify and Observer is not None:
+        observer = Observer()
+        observer.schedule(RecordingEvents(tracker, lock), audio_folder, recursive=True)
+        observer.start()
+        print(f"Watching {audio_folder} for new recordings")
+    else:
+        observer = None
+        print(f"Polling {audio_folder} for new recordings every {poll_interval} seconds")
+
+    last_scan = time.monotonic()
+    with closing(archive_index.connect(audio_folder)) as conn:
+        while True:
+            time.sleep(1)
+            if observer is None and time.monotonic() - last_scan >= poll_interval:
+                scan_untranscribed(audio_folder, tracker, lock)
+                last_scan = time.monotonic()
+
+            with lock:
+                settled = tracker.poll()
+            for path in settled:
+                if os.path.exists(archive_index.transcript_path(path)):
+                    continue
+                try:
+                    duration = read_header(path).duration
+                except (WavError, OSError) as e:
+                    # Not a WAV we can read (yet); it is looked at again when it changes
+                    print(f"Not queuing {path}: {e}")
+                    continue
+                audio_path = os.path.relpath(path, audio_folder)
+                transcription_queue.enqueue(conn, audio_path, duration)
+                print(f"Queued {audio_path} ({duration / 60:.1f} minutes)")
+
+def work(audio_folder, model_name=DEFAULT_MODEL, workers=1, threads=None, chunk_minutes=None, cache_dir=content_cache.DEFAULT_CACHE_DIR,
+         export_formats=export.DEFAULT_FORMATS, word_timestamps=False):
+    """Transcribe queued recordings one at a time, forever."""
+    # The key make_transcriber's transcriber records its speed under
+    job_speed_key = speed_key(model_name, workers, threads)
+    # The model is loaded on the first job and kept for the next ones
+    transcriber = None
+    with closing(archive_index.connect(audio_folder)) as conn:
+        requeued = transcription_queue.requeue_abandoned(conn)
+        if requeued:
+            print(f"Queued {len(requeued)} interrupted job(s) again.")
+        try:
+            while True:
+                # The measured speed is stored with the job, for the ETA shown in the browser
+                speed = throughput.estimate(job_speed_key)
+                job = transcription_queue.claim_next(conn, speed)
+                if job is None:
+                    time.sleep(QUEUE_INTERVAL)
+                    continue
+
+                audio_file = os.path.join(audio_folder, job["path"])
+                print(f"Transcribing {job['path']}, estimated time: {throughput.format_eta(job['duration'] / speed)}")
+                if transcriber is None:
+                    transcriber = make_transcriber(model_name, workers, threads, chunk_minutes, word_timestamps)
+                _, status, _ = transcribe_claimed(audio_file, transcriber, cache_dir, export_formats)
+
+                if status == "failed":
+                    transcription_queue.finish(conn, job["path"], "Transcription failed, see the watcher's log")
+                    continue
+                transcription_queue.finish(conn, job["path"])
+                if status == "done":
+                    # Show the new transcript in the browser without waiting for its next scan
+                    archive_index.update_transcript(conn, audio_folder, archive_index.transcript_path(job["path"]))
+        finally:
+            if transcriber is not None:
+                transcriber.close()
+
+def main(audio_folder, model_name=DEFAULT_MODEL, workers=1, threads=None, chunk_minutes=None, cache_dir=content_cache.DEFAULT_CACHE_DIR,
+         export_formats=export.DEFAULT_FORMATS, word_timestamps=False, settle_seconds=SETTLE_SECONDS, poll_interval=POLL_INTERVAL,
+         use_inotify=True):
+    if not os.path.isdir(audio_folder):
+        print(f"Error: The folder '{audio_folder}' does not exist.")
+        return
+    if use_inotify and Observer is None:
+        print("watchdog is not installed, falling back to polling (pip install watchdog)")
+
+    threading.Thread(
+        target=watch, args=(audio_folder, settle_seconds, poll_interval, use_inotify), daemon=True
+    ).start()
+    try:
+        work(audio_folder, model_name, workers, threads, chunk_minutes, cache_dir, export_formats, word_timestamps)
+    except KeyboardInterrupt:
+        print("Stopped.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a folder and transcribe new .wav files as they arrive.")
+    parser.add_argument("audio_folder", type=str, help="Audio folder to watch, as passed to audio_browser.py.")
+    parser.add_argument("-m", "--model", type=str, default=DEFAULT_MODEL, help=f"Whisper model to use (default: {DEFAULT_MODEL}).")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="With --chunk-minutes, transcribe the chunks of each file in this many worker processes (default: 1).")
+    parser.add_argument("-t", "--threads", type=int, help="Torch threads per worker (default: CPU cores divided by workers).")
+    parser.add_argument("-c", "--chunk-minutes", type=float, help="Transcribe long recordings in chunks of about this length, cut at silences.")
+    parser.add_argument("--cache-dir", type=str, default=content_cache.DEFAULT_CACHE_DIR, help=f"Cache of transcripts by audio content (default: {content_cache.DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--no-cache", action="store_true", help="Neither use nor fill the transcript cache.")
+    parser.add_argument("--word-timestamps", action="store_true", help="Also record when each word starts and ends, in a .words file next to each .json.")
+    parser.add_argument("-e", "--export", nargs="+", choices=["srt", "vtt"], default=[], help="Also write subtitles in these formats next to each .txt.")
+    parser.add_argument("--settle-seconds", type=float, default=SETTLE_SECONDS, help=f"Wait until a file has not changed for this long before queuing it (default: {SETTLE_SECONDS}).")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help=f"Seconds between scans of the folder when polling (default: {POLL_INTERVAL}).")
+    parser.add_argument("--poll", action="store_true", help="Poll the folder even if watchdog is installed, e.g. on network shares without inotify.")
+    args = parser.parse_args()
+
+    main(
+        args.audio_folder, args.model, args.workers, args.threads, args.chunk_minutes,
+        None if args.no_cache else args.cache_dir, (*export.DEFAULT_FORMATS, *args.export), args.word_timestamps, args.settle_seconds, args.poll_interval, not args.poll
+    )
@@ -0,0 +1,169 @@
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+WavInfo = namedtuple(
+    "WavInfo",
+    ["channels", "sample_rate", "bits_per_sample", "format_tag", "data_offset", "data_size", "frames", "duration"]
+)
+
+class WavError(Exception):
+    pass
+
+def read_header(path):
+    """Parse the RIFF/WAVE header of path without reading the sample data."""
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] not in (b"RIFF", b"RF64") or riff[8:12] != b"WAVE":
+            raise WavError(f"Not a WAV file: {path}")
+        rf64 = riff[:4] == b"RF64"
+
+        fmt = None
+        data_size64 = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise WavError(f"No data chunk in {path}")
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+
+            if chunk_id == b"ds64":
+                # RF64 keeps the real data size in ds64 for files over 4 GB
+                ds64 = f.read(16)
+                if len(ds64) < 16:
+                    raise WavError(f"Truncated ds64 chunk in {path}")
+                data_size64 = struct.unpack("<Q", ds64[8:16])[0]
+                f.seek(chunk_size - 16 + (chunk_size & 1), 1)
+            elif chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                if chunk_size & 1:
+                    f.seek(1, 1)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise WavError(f"data chunk before fmt chunk in {path}")
+                data_offset = f.tell()
+                if rf64 and data_size64 is not None:
+                    chunk_size = data_size64
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+        f.seek(0, 2)
+        file_size = f.tell()
+
+    if len(fmt) < 16:
+        raise WavError(f"Truncated fmt chunk in {path}")
+    format_tag, channels, sample_rate, _, _, bits_per_sample = struct.unpack("<HHIIHH", fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        # The first two bytes of the sub-format GUID hold the actual format tag
+        format_tag = struct.unpack("<H", fmt[24:26])[0]
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        raise WavError(f"Unsupported WAV format {format_tag:#x} in {path}")
+    valid_bits = (32, 64) if format_tag == WAVE_FORMAT_IEEE_FLOAT else (8, 16, 24, 32)
+    if channels == 0 or sample_rate == 0 or bits_per_sample not in valid_bits:
+        raise WavError(f"Invalid WAV header in {path}")
+
+    # Recorders interrupted mid-take leave a data size that runs past the end of the file
+    data_size = min(chunk_size, file_size - data_offset)
+    frame_size = channels * bits_per_sample // 8
+    frames = data_size // frame_size
+    return WavInfo(
+        channels, sample_rate, bits_per_sample, format_tag,
+        data_offset, frames * frame_size, frames, frames / sample_rate
+    )
+
+def memmap_frames(path, info=None):
+    """Memory-map the sample data of a WAV file as a (frames, channels) array.
+
+    24-bit files are mapped as raw bytes with shape (frames, channels, 3); use
+    to_float() to convert slices of either kind to float32 in [-1, 1].
+    """
+    if info is None:
+        info = read_header(path)
+    if info.frames == 0:
+        return np.zeros((0, info.channels), dtype=np.int16), info
+    if info.bits_per_sample == 24:
+        shape = (info.frames, info.channels, 3)
+        dtype = np.uint8
+    else:
+        shape = (info.frames, info.channels)
+        if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            dtype = {32: "<f4", 64: "<f8"}[info.bits_per_sample]
+        else:
+            dtype = {8: np.uint8, 16: "<i2", 32: "<i4"}[info.bits_per_sample]
+    frames = np.memmap(path, dtype=dtype, mode="r", offset=info.data_offset, shape=shape)
+    return frames, info
+
+def to_float(frames, info):
+    """Convert a slice of memmap_frames() output to float32 samples in [-1, 1]."""
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return np.asarray(frames, dtype=np.float32)
+    if info.bits_per_sample == 8:
+        return (np.asarray(frames, dtype=np.float32) - 128) / 128
+    if info.bits_per_sample == 24:
+        raw = np.asarray(frames, dtype=np.int32)
+        samples = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+        samples = np.where(samples & 0x800000, samples - 0x1000000, samples)
+        return samples.astype(np.float32) / 8388608
+    scale = float(1 << (info.bits_per_sample - 1))
+    return np.asarray(frames, dtype=np.float32) / scale
+
+# Frames mixed per step by mix_to_stereo()
+MIX_BLOCK_FRAMES = 1 << 18
+
+def header_bytes(channels, sample_rate, bits_per_sample, frames):
+    """RIFF/WAVE header of a PCM file; RF64 when the data does not fit a 32-bit RIFF size."""
+    block_align = channels * bits_per_sample // 8
+    data_size = frames * block_align
+    fmt = struct.pack(
+        "<4sIHHIIHH", b"fmt ", 16, WAVE_FORMAT_PCM, channels, sample_rate,
+        sample_rate * block_align, block_align, bits_per_sample
+    )
+    if 36 + data_size <= 0xFFFFFFFF:
+        return struct.pack("<4sI4s", b"RIFF", 36 + data_size, b"WAVE") + fmt + struct.pack("<4sI", b"data", data_size)
+    ds64 = struct.pack("<4sIQQQI", b"ds64", 28, 36 + 36 + data_size, data_size, frames, 0)
+    return (
+        struct.pack("<4sI4s", b"RF64", 0xFFFFFFFF, b"WAVE") + ds64 + fmt
+        + struct.pack("<4sI", b"data", 0xFFFFFFFF)
+    )
+
+def mix_to_stereo(paths, output_path):
+    """Sum mono WAV files into a 16-bit stereo WAV with the mix on both channels.
+
+    Matches ffmpeg's amix=normalize=0 followed by -ac 2: inputs are added
+    without scaling, shorter ones are padded with silence and the sum is
+    clipped. The inputs are streamed block by block from memory maps, and the
+    output is written to a temporary file renamed into place.
+    """
+    inputs = [memmap_frames(path) for path in paths]
+    sample_rate = inputs[0][1].sample_rate
+    for path, (_, info) in zip(paths, inputs):
+        if info.channels != 1 or info.sample_rate != sample_rate:
+            raise WavError(f"Cannot mix {path}: expected mono at {sample_rate} Hz")
+    frames = max(info.frames for _, info in inputs)
+
+    dirpath, filename = os.path.split(os.path.abspath(output_path))
+    tmp_path = os.path.join(dirpath, f".{filename}.mixing")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header_bytes(2, sample_rate, 16, frames))
+            for start in range(0, frames, MIX_BLOCK_FRAMES):
+                count = min(MIX_BLOCK_FRAMES, frames - start)
+                mix = np.zeros(count, dtype=np.float32)
+                for data, info in inputs:
+                    block = data[start:start + count]
+                    if len(block):
+                        mix[:len(block)] += to_float(block, info).reshape(len(block))
+                samples = np.clip(np.rint(mix * 32768), -32768, 32767).astype("<i2")
+                f.write(np.repeat(samples, 2).tobytes())
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return frames / sample_rate
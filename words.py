@@ -0,0 +1,116 @@
+import os
+import struct
+
+import numpy as np
+
+from jsonfile import atomic_write
+
+MAGIC = b"WRDS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIII")  # magic, version, reserved, segments, words, text bytes
+
+# Layout after the header, all little-endian:
+#   uint32[segments + 1]  index of the first word of each segment, then the word count
+#   float32[words]        word starts, in seconds
+#   float32[words]        word ends, in seconds
+#   uint32[words + 1]     byte offset of each word in the text blob, then its length
+#   text blob             the words, UTF-8, back to back
+
+def words_path(json_path):
+    """Path of the .words sidecar belonging to a transcript .json."""
+    return os.path.splitext(json_path)[0] + ".words"
+
+def has_words(segments):
+    return any(segment.get("words") for segment in segments)
+
+def remove_words(json_path):
+    """Delete the .words sidecar of json_path, if any, once its segments are replaced."""
+    try:
+        os.remove(words_path(json_path))
+    except FileNotFoundError:
+        pass
+
+def write_words(json_path, segments):
+    """Store the word timings of whisper segments in the .words sidecar of json_path.
+
+    Segments without word timings remove a sidecar left from an earlier run, so
+    the words never belong to another segmentation. Returns the path, or None.
+    """
+    path = words_path(json_path)
+    if not has_words(segments):
+        remove_words(json_path)
+        return None
+
+    segment_index = [0]
+    starts = []
+    ends = []
+    text_offsets = [0]
+    blob = bytearray()
+    for segment in segments:
+        for word in segment.get("words") or []:
+            starts.append(word["start"])
+            ends.append(word["end"])
+            blob += word["word"].encode("utf-8")
+            text_offsets.append(len(blob))
+        segment_index.append(len(starts))
+
+    with atomic_write(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(segments), len(starts), len(blob)))
+        f.write(np.asarray(segment_index, dtype="<u4").tobytes())
+        f.write(np.asarray(starts, dtype="<f4").tobytes())
+        f.write(np.asarray(ends, dtype="<f4").tobytes())
+        f.write(np.asarray(text_offsets, dtype="<u4").tobytes())
+        f.write(bytes(blob))
+    return path
+
+def try_write_words(json_path, segments):
+    """Pipeline hook: write the .words sidecar, reporting instead of failing the transcription."""
+    try:
+        path = write_words(json_path, segments)
+        if path:
+            print(f"Word timings saved to {os.path.basename(path)}")
+    except (OSError, KeyError, TypeError) as e:
+        print(f"Skipping word timings: {e}")
+
+def read_words(path, first=0, last=None):
+    """Read the words of segments first to last (exclusive) from a .words sidecar.
+
+    Only the index entries, timings and text of those segments are read.
+    """
+    with open(path, "rb") as f:
+        magic, version, _, segment_count, word_count, text_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a words file: {path}")
+        last = segment_count if last is None else min(last, segment_count)
+        first = max(0, min(first, last))
+
+        index_offset = HEADER.size
+        starts_offset = index_offset + 4 * (segment_count + 1)
+        ends_offset = starts_offset + 4 * word_count
+        text_offsets_offset = ends_offset + 4 * word_count
+        blob_offset = text_offsets_offset + 4 * (word_count + 1)
+
+        def read_array(offset, start, count, dtype):
+            f.seek(offset + 4 * start)
+            return np.frombuffer(f.read(4 * count), dtype=dtype)
+
+        segment_index = read_array(index_offset, first, last - first + 1, "<u4")
+        first_word, last_word = int(segment_index[0]), int(segment_index[-1])
+        starts = read_array(starts_offset, first_word, last_word - first_word, "<f4")
+        ends = read_array(ends_offset, first_word, last_word - first_word, "<f4")
+        text_offsets = read_array(text_offsets_offset, first_word, last_word - first_word + 1, "<u4")
+        f.seek(blob_offset + int(text_offsets[0]))
+        blob = f.read(int(text_offsets[-1] - text_offsets[0]))
+
+    text_offsets = text_offsets - text_offsets[0]
+    segments = []
+    for i in range(last - first):
+        words = []
+        for w in range(int(segment_index[i]) - first_word, int(segment_index[i + 1]) - first_word):
+            words.append({
+                "word": blob[text_offsets[w]:text_offsets[w + 1]].decode("utf-8"),
+                "start": round(float(starts[w]), 3),
+                "end": round(float(ends[w]), 3)
+            })
+        segments.append({"index": first + i, "words": words})
+    return {"segment_count": segment_count, "segments": segments}